@@ -0,0 +1,63 @@
+"""Measures memory taken by nodes and by the qt_data of stored children.
+
+Run with: python -m benchmarks.memory
+"""
+import sys
+from random import uniform
+
+from quadpy import Node
+from quadpy.rectangle import random_rectangle
+
+
+def node_size(node):
+    """Returns bytes taken by node, its own lists and bounds."""
+    size = sys.getsizeof(node)
+    if hasattr(node, '__dict__'):
+        size += sys.getsizeof(node.__dict__)
+    size += sys.getsizeof(node.direct_children)
+    size += sys.getsizeof(node.quadrants)
+    size += sys.getsizeof(node.bounds)
+    size += sum(sys.getsizeof(side) for side in node.bounds)
+    return size
+
+
+def iter_nodes(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.quadrants)
+
+
+def main(n_children=50000, max_depth=9, n_moves=5):
+    children = [random_rectangle((0, 0, 1000, 1000), 5)
+                for _ in range(n_children)]
+    qt = Node(0, 0, 1000, 1000, max_depth)
+    qt.insert_many(children)
+
+    nodes = list(iter_nodes(qt))
+    node_bytes = sum(node_size(n) for n in nodes)
+    print('{0} nodes: {1:.1f} bytes per node'.format(
+        len(nodes), node_bytes / float(len(nodes))))
+
+    records = dict((id(ch.qt_data), ch.qt_data) for ch in children)
+    item_bytes = sum(sys.getsizeof(r) for r in records.values())
+    print('{0} children: {1:.1f} bytes of qt_data per child'.format(
+        n_children, item_bytes / float(n_children)))
+
+    # count qt_data records created while children move around
+    created = 0
+    for _ in range(n_moves):
+        for ch in children:
+            dx, dy = uniform(-20, 20), uniform(-20, 20)
+            x_min, y_min, x_max, y_max = ch.bounds
+            before = ch.qt_data
+            ch.bounds = (x_min + dx, y_min + dy, x_max + dx, y_max + dy)
+            qt.reinsert(ch)
+            created += ch.qt_data is not before
+    print('{0} moves: {1} new qt_data records'.format(
+        n_children * n_moves, created))
+
+
+if __name__ == '__main__':
+    main()
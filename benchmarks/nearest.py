@@ -0,0 +1,50 @@
+"""Compares Node.nearest and Node.within_radius with brute force.
+
+Run with: python -m benchmarks.nearest
+"""
+from random import uniform
+from timeit import default_timer as timer
+
+from quadpy import Node
+from quadpy.quadtree import distance
+from quadpy.rectangle import random_rectangle
+
+
+def brute_nearest(children, x, y, k):
+    return sorted(children, key=lambda ch: distance(x, y, ch.bounds))[:k]
+
+
+def brute_within_radius(children, x, y, radius):
+    return [ch for ch in children if distance(x, y, ch.bounds) <= radius]
+
+
+def main(n_children=20000, n_queries=200):
+    bounds = (0, 0, 1000, 1000)
+    children = [random_rectangle(bounds, 5) for _ in range(n_children)]
+    qt = Node(*(bounds + (8,)))
+    qt.insert_many(children)
+    points = [(uniform(0, 1000), uniform(0, 1000)) for _ in range(n_queries)]
+
+    for k in [1, 10, 100]:
+        start = timer()
+        [qt.nearest(x, y, k) for x, y in points]
+        tree = timer() - start
+        start = timer()
+        [brute_nearest(children, x, y, k) for x, y in points]
+        brute = timer() - start
+        print('nearest k={0:<4} tree {1:.4f}s  brute force {2:.4f}s'
+              .format(k, tree, brute))
+
+    for radius in [5, 20, 100]:
+        start = timer()
+        [qt.within_radius(x, y, radius) for x, y in points]
+        tree = timer() - start
+        start = timer()
+        [brute_within_radius(children, x, y, radius) for x, y in points]
+        brute = timer() - start
+        print('within_radius r={0:<4} tree {1:.4f}s  brute force {2:.4f}s'
+              .format(radius, tree, brute))
+
+
+if __name__ == '__main__':
+    main()
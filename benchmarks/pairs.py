@@ -0,0 +1,37 @@
+"""Compares Node.overlapping_pairs with querying each child separately.
+
+Run with: python -m benchmarks.pairs
+"""
+from timeit import default_timer as timer
+
+from quadpy import Node
+from quadpy.rectangle import random_rectangle
+
+
+def pairs_by_queries(qt, children):
+    # every pair is found twice (and every child overlaps itself)
+    return [(ch, other) for ch in children
+            for other in qt.get_overlapped_children(ch.bounds)
+            if other is not ch]
+
+
+def main():
+    bounds = (0, 0, 1000, 1000)
+    for n_children in [1000, 10000, 40000]:
+        children = [random_rectangle(bounds, 10) for _ in range(n_children)]
+        qt = Node(*(bounds + (8,)))
+        qt.insert_many(children)
+
+        start = timer()
+        n_pairs = len(list(qt.overlapping_pairs()))
+        pairs = timer() - start
+        start = timer()
+        n_query_pairs = len(pairs_by_queries(qt, children))
+        queries = timer() - start
+        assert n_query_pairs == 2 * n_pairs
+        print('{0:>6} children, {1:>6} pairs: overlapping_pairs {2:.4f}s  '
+              'queries {3:.4f}s'.format(n_children, n_pairs, pairs, queries))
+
+
+if __name__ == '__main__':
+    main()
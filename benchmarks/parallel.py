@@ -0,0 +1,37 @@
+"""Measures QueryPool with growing worker counts.
+
+Run with: python -m benchmarks.parallel
+"""
+from multiprocessing import cpu_count
+from timeit import default_timer as timer
+
+from quadpy import Node
+from quadpy.parallel import QueryPool
+from quadpy.rectangle import random_bounds, random_rectangle
+
+
+def main(n_children=100000, n_queries=20000, max_depth=9):
+    bounds = (0, 0, 1000, 1000)
+    children = [random_rectangle(bounds, 5) for _ in range(n_children)]
+    queries = [random_bounds(bounds, 20) for _ in range(n_queries)]
+
+    qt = Node(*(bounds + (max_depth,)))
+    qt.insert_many(children)
+    start = timer()
+    qt.query_many(queries)
+    query = timer() - start
+    print('{0} CPUs'.format(cpu_count()))
+    print('workers      query')
+    print('      - {0:9.4f}s'.format(query))
+
+    workers = 1
+    while workers <= max(4, cpu_count()):
+        with QueryPool(qt, workers) as pool:
+            start = timer()
+            pool.query_many(queries)
+            query = timer() - start
+        print('{0:7} {1:9.4f}s'.format(workers, query))
+        workers *= 2
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Measures pickling and unpickling of a tree, and the size of the pickle.
+
+Run with: python -m benchmarks.pickling
+"""
+from timeit import default_timer as timer
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from quadpy import Node
+from quadpy.rectangle import random_rectangle
+
+
+def main(n_children=50000, max_depth=9):
+    bounds = (0, 0, 1000, 1000)
+    children = [random_rectangle(bounds, 5) for _ in range(n_children)]
+    qt = Node(*(bounds + (max_depth,)))
+    qt.insert_many(children)
+    nodes = qt._get_number_of_nodes()
+    for protocol in sorted(set([2, pickle.HIGHEST_PROTOCOL])):
+        start = timer()
+        data = pickle.dumps(qt, protocol)
+        dump = timer() - start
+        start = timer()
+        pickle.loads(data)
+        load = timer() - start
+        print('protocol {0}, {1} nodes, {2} children: dump {3:.4f}s  '
+              'load {4:.4f}s  size {5:.1f} MB'.format(
+                  protocol, nodes, n_children, dump, load,
+                  len(data) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Compares query_many with running queries one by one.
+
+Run with: python -m benchmarks.query_many
+"""
+from timeit import default_timer as timer
+
+from quadpy import Node
+from quadpy.rectangle import random_bounds
+
+try:
+    import numpy as np
+    from quadpy.arrayindex import ArrayIndex
+except ImportError:
+    np = None
+
+
+def main(n_children=20000, n_queries=2000, query_size=20):
+    bounds = (0, 0, 1000, 1000)
+    item_bounds = [random_bounds(bounds, 5) for _ in range(n_children)]
+    queries = [random_bounds(bounds, query_size) for _ in range(n_queries)]
+
+    qt = Node.from_bounds(item_bounds, 8, bounds)
+    start = timer()
+    [qt.get_overlapped_children(q) for q in queries]
+    single = timer() - start
+    start = timer()
+    qt.query_many(queries)
+    batch = timer() - start
+    print('Node        one by one {0:.4f}s  query_many {1:.4f}s'
+          .format(single, batch))
+
+    if np is None:
+        return
+    index = ArrayIndex(*(bounds + (8,)))
+    index.build(item_bounds)
+    start = timer()
+    [index.get_overlapped_children(q) for q in queries]
+    single = timer() - start
+    start = timer()
+    index.query_many(queries)
+    batch = timer() - start
+    print('ArrayIndex  one by one {0:.4f}s  query_many {1:.4f}s'
+          .format(single, batch))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Measures moving children by small steps, as in a per-frame update.
+
+Run with: python -m benchmarks.reinsert
+"""
+from random import uniform
+from timeit import default_timer as timer
+
+from quadpy import Node
+from quadpy.rectangle import random_rectangle
+
+
+def move(children, step):
+    for ch in children:
+        dx, dy = uniform(-step, step), uniform(-step, step)
+        x_min, y_min, x_max, y_max = ch.bounds
+        ch.bounds = (x_min + dx, y_min + dy, x_max + dx, y_max + dy)
+
+
+def main(n_children=20000, n_frames=5, step=2):
+    bounds = (0, 0, 1000, 1000)
+    children = [random_rectangle((100, 100, 900, 900), 5)
+                for _ in range(n_children)]
+    qt = Node(*(bounds + (9,)))
+    qt.insert_many(children)
+
+    reinsert = remove_insert = move_many = 0
+    for _ in range(n_frames):
+        move(children, step)
+        start = timer()
+        for ch in children:
+            qt.reinsert(ch)
+        reinsert += timer() - start
+
+        move(children, step)
+        start = timer()
+        qt.move_many([(ch, ch.bounds) for ch in children])
+        move_many += timer() - start
+
+        move(children, step)
+        start = timer()
+        for ch in children:
+            qt.remove(ch)
+            qt.insert(ch)
+        remove_insert += timer() - start
+    print('{0} children, {1} frames: reinsert {2:.4f}s  move_many {3:.4f}s  '
+          'remove + insert {4:.4f}s'.format(n_children, n_frames, reinsert,
+                                            move_many, remove_insert))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Measures query throughput of reader threads while a writer thread keeps
+moving children, with locked queries and with snapshot queries.
+
+Run with: python -m benchmarks.threads
+"""
+import threading
+from timeit import default_timer as timer
+
+from quadpy import Node
+from quadpy.rectangle import random_bounds, random_rectangle
+from quadpy.threadsafe import ThreadSafeTree
+
+
+def run(tree, children, n_readers, use_snapshot, duration):
+    stop = threading.Event()
+    counts = [0] * n_readers
+    queries = [random_bounds((0, 0, 1000, 1000), 50) for _ in range(1000)]
+
+    def read(i):
+        n = 0
+        while not stop.is_set():
+            query = queries[n % len(queries)]
+            if use_snapshot:
+                tree.snapshot.get_overlapped_children(query)
+            else:
+                tree.get_overlapped_children(query)
+            n += 1
+        counts[i] = n
+
+    def write():
+        i = 0
+        while not stop.is_set():
+            batch = children[i:i + 100]
+            tree.move_many((ch, random_rectangle((0, 0, 1000, 1000),
+                                                 5).bounds) for ch in batch)
+            i = (i + 100) % len(children)
+            if use_snapshot:
+                tree.publish()
+
+    threads = ([threading.Thread(target=read, args=(i,))
+                for i in range(n_readers)] + [threading.Thread(target=write)])
+    start = timer()
+    [t.start() for t in threads]
+    stop.wait(duration)
+    stop.set()
+    [t.join() for t in threads]
+    return sum(counts) / (timer() - start)
+
+
+def main(n_children=5000, duration=2.0):
+    children = [random_rectangle((0, 0, 1000, 1000), 5)
+                for _ in range(n_children)]
+    qt = Node(0, 0, 1000, 1000, 8)
+    qt.insert_many(children)
+    tree = ThreadSafeTree(qt)
+    for n_readers in [1, 2, 4, 8]:
+        locked = run(tree, children, n_readers, False, duration)
+        snapshot = run(tree, children, n_readers, True, duration)
+        print('{0} readers: locked {1:.0f} queries/s  snapshot {2:.0f} '
+              'queries/s'.format(n_readers, locked, snapshot))
+
+
+if __name__ == '__main__':
+    main()
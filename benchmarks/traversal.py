@@ -0,0 +1,41 @@
+"""Measures inserts, queries and clearing for trees of growing depth.
+
+Run with: python -m benchmarks.traversal
+"""
+from timeit import default_timer as timer
+
+from quadpy import Node
+from quadpy.rectangle import random_bounds, random_rectangle
+
+
+def main(n_children=10000, n_queries=500, depths=(4, 8, 12, 16)):
+    bounds = (0, 0, 1000, 1000)
+    queries = [random_bounds(bounds, 50) for _ in range(n_queries)]
+    print('depth   insert  overlapped  enclosed  children     clear')
+    for max_depth in depths:
+        children = [random_rectangle(bounds, 0.5) for _ in range(n_children)]
+        qt = Node(*(bounds + (max_depth,)))
+        start = timer()
+        for ch in children:
+            qt.insert(ch)
+        insert = timer() - start
+
+        start = timer()
+        [qt.get_overlapped_children(q) for q in queries]
+        overlapped = timer() - start
+        start = timer()
+        [qt.get_enclosed_children(q) for q in queries]
+        enclosed = timer() - start
+        start = timer()
+        for _ in range(20):
+            qt.get_children()
+        all_children = timer() - start
+        start = timer()
+        qt.clear()
+        clear = timer() - start
+        print('{0:5} {1:8.4f} {2:11.4f} {3:9.4f} {4:9.4f} {5:9.4f}'.format(
+            max_depth, insert, overlapped, enclosed, all_children, clear))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Compares Viewport.move with querying again and diffing results.
+
+Run with: python -m benchmarks.viewport
+"""
+from timeit import default_timer as timer
+
+from quadpy import Node
+from quadpy.rectangle import random_bounds
+
+
+def main(n_children=50000, n_moves=500, size=300, step=3):
+    bounds = (0, 0, 1000, 1000)
+    qt = Node.from_bounds([random_bounds(bounds, 5)
+                           for _ in range(n_children)], 8, bounds)
+    views = [(x, x, x + size, x + size)
+             for x in range(0, n_moves * step, step)]
+
+    start = timer()
+    visible = set(qt.get_overlapped_children(views[0]))
+    for view in views[1:]:
+        found = set(qt.get_overlapped_children(view))
+        entered, exited = found - visible, visible - found
+        visible = found
+    query = timer() - start
+
+    start = timer()
+    viewport = qt.viewport(views[0])
+    for view in views[1:]:
+        entered, exited = viewport.move(view)
+    moves = timer() - start
+    print('query and diff {0:.4f}s  viewport moves {1:.4f}s'
+          .format(query, moves))
+
+
+if __name__ == '__main__':
+    main()
@@ -156,19 +156,27 @@ def create_marquee_rect(evt, hsm):
     rect_id = canvas.create_rectangle((evt.x, evt.y, evt.x, evt.y),
                                       outline='orange')
     hsm.data.canvas_marquee = (evt.x, evt.y, rect_id)
-    select_elems([])
+    hsm.data.marquee = quad.viewport((evt.x, evt.y, evt.x, evt.y))
+    select_elems(hsm.data.marquee.get_children())
 
 
 def drag_marquee_rect(evt, hsm):
     x, y, rect_id = hsm.data.canvas_marquee
     bounds = (x, y, evt.x, evt.y)
-    select_elems(quad.get_overlapped_children(bounds))
+    # recolor only elements that entered or left the marquee, selection is
+    # collected once the marquee is released
+    entered, exited = hsm.data.marquee.move(bounds)
+    [canvas.itemconfig(e.canvas_id, outline='blue') for e in exited]
+    [canvas.itemconfig(e.canvas_id, outline='red') for e in entered]
     canvas.coords(rect_id, bounds)
 
 
 def clear_marquee_rect(evt, hsm):
+    global selected_elems
     _, _, rect_id = hsm.data.canvas_marquee
     canvas.delete(rect_id)
+    selected_elems = [(el, el.bounds)
+                      for el in hsm.data.marquee.get_children()]
 
 
 # define HSM state structure and transitions between states:
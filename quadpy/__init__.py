@@ -1,3 +1,6 @@
 import quadtree
+import index
 Node = quadtree.Node
-__all__ = ['Node']
+NodePool = quadtree.NodePool
+Index = index.Index
+__all__ = ['Node', 'NodePool', 'Index']
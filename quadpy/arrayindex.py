@@ -0,0 +1,458 @@
+"""
+Array-backed MX-CIF quadtree index, requires numpy.
+
+Items are given as bounds only, queries return arrays of integer ids. Items
+are placed into exactly the same cells as `quadtree.Node` would place them,
+but instead of Node objects the tree is kept in a few flat arrays:
+
+* items are sorted so that every node's items (and, since nodes are stored in
+  depth-first order, every node's whole subtree) form a contiguous range
+* node bounds and item bounds are stored in (4, n) float64 arrays, one
+  contiguous row per side (x_min, y_min, x_max, y_max)
+
+Queries descend the tree one level at a time and test all nodes of a level
+and all their items with vectorized masks.
+
+All arrays can be written into a single flat block, either a file (`save`)
+that is later memory-mapped by `load`, or a block of shared memory (`share`)
+that other processes map read-only (`attach`) instead of copying the index.
+"""
+import os
+import tempfile
+from mmap import mmap as memory_map, ACCESS_READ
+
+import numpy as np
+
+from quadtree import fix_bounds
+
+
+# node keys are (path << 2 * (max_depth - depth)) * 32 + depth, which must fit
+# into int64 and is what limits the depth
+MAX_DEPTH = 28
+
+_empty_ids = np.empty(0, dtype=np.int64)
+
+# flat layout: magic, header of int64 values (format version, max_depth,
+# number of items, number of nodes), float64 root bounds, then the arrays
+# (each a multiple of 8 bytes, so all stay aligned) in order of _ARRAYS
+_MAGIC = b'QPYAIDX\x00'
+FORMAT_VERSION = 1
+_HEADER_SIZE = len(_MAGIC) + 4 * 8 + 4 * 8
+_ARRAYS = [
+    # name, dtype, shape for n items and m nodes
+    ('_item_bounds', np.float64, lambda n, m: (4, n)),
+    ('_item_ids', np.int64, lambda n, m: (n,)),
+    ('_node_bounds', np.float64, lambda n, m: (4, m)),
+    ('_node_children', np.int64, lambda n, m: (m, 4)),
+    ('_node_start', np.int64, lambda n, m: (m,)),
+    ('_node_end', np.int64, lambda n, m: (m,)),
+    ('_node_subtree_end', np.int64, lambda n, m: (m,)),
+]
+
+# shared blocks are files in a memory-backed file system where there is one
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def _shared_path(name):
+    if not name or os.sep in name:
+        raise ValueError("invalid shared block name: {0!r}".format(name))
+    return os.path.join(SHARED_DIR, name)
+
+
+def unlink(name):
+    """Removes shared block created by ArrayIndex.share, indexes attached to
+    it stay usable until they are dropped."""
+    os.remove(_shared_path(name))
+
+
+def _ranges(starts, ends):
+    """Returns concatenation of arange(start, end) for all start, end pairs."""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return _empty_ids
+    shifts = starts - (np.cumsum(lengths) - lengths)
+    return np.repeat(shifts, lengths) + np.arange(total, dtype=np.int64)
+
+
+def _as_bounds_array(bounds):
+    """Returns (4, n) float64 array of normalized bounds."""
+    b = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+    return np.array([np.minimum(b[:, 0], b[:, 2]),
+                     np.minimum(b[:, 1], b[:, 3]),
+                     np.maximum(b[:, 0], b[:, 2]),
+                     np.maximum(b[:, 1], b[:, 3])])
+
+
+def locate(item_bounds, root_bounds, max_depth):
+    """Returns (paths, depths) arrays of the nodes the items would end up in.
+
+    `item_bounds` must be a normalized (4, n) array. Path is a base-4 number
+    made of quadrant indices (TL=0, TR=1, BL=2, BR=3) on the way from root,
+    depth is its number of digits. Items not fitting the root stay in root.
+    """
+    x_min, y_min, x_max, y_max = item_bounds
+    n = x_min.shape[0]
+    paths = np.zeros(n, dtype=np.int64)
+    depths = np.zeros(n, dtype=np.int64)
+
+    rx_min, ry_min, rx_max, ry_max = root_bounds
+    active = np.flatnonzero((x_min >= rx_min) & (x_max <= rx_max) &
+                            (y_min >= ry_min) & (y_max <= ry_max))
+    nx_min = np.full(active.shape, rx_min, dtype=np.float64)
+    ny_min = np.full(active.shape, ry_min, dtype=np.float64)
+    nx_max = np.full(active.shape, rx_max, dtype=np.float64)
+    ny_max = np.full(active.shape, ry_max, dtype=np.float64)
+
+    for _ in range(max_depth):
+        if not active.size:
+            break
+        x_center = (nx_min + nx_max) / 2.0
+        y_center = (ny_min + ny_max) / 2.0
+        # items already fit the node, so only the center lines matter; when
+        # an item fits both sides (zero width on the line) Node picks the
+        # first quadrant, which is the left / top one
+        left = x_max[active] <= x_center
+        top = y_max[active] <= y_center
+        down = ((left | (x_min[active] >= x_center)) &
+                (top | (y_min[active] >= y_center)))
+        active, left, top = active[down], left[down], top[down]
+        x_center, y_center = x_center[down], y_center[down]
+        nx_min = np.where(left, nx_min[down], x_center)
+        nx_max = np.where(left, x_center, nx_max[down])
+        ny_min = np.where(top, ny_min[down], y_center)
+        ny_max = np.where(top, y_center, ny_max[down])
+        paths[active] = paths[active] * 4 + (~top) * 2 + (~left)
+        depths[active] += 1
+
+    return paths, depths
+
+
+def path_bounds(paths, depths, root_bounds):
+    """Returns (4, n) array of bounds of nodes given by paths and depths."""
+    n = paths.shape[0]
+    bounds = np.empty((4, n), dtype=np.float64)
+    for i, side in enumerate(root_bounds):
+        bounds[i] = side
+    nx_min, ny_min, nx_max, ny_max = bounds
+    for level in range(int(depths.max()) if n else 0):
+        sel = np.flatnonzero(depths > level)
+        digit = (paths[sel] >> (2 * (depths[sel] - level - 1))) & 3
+        # compute centers the same way Node.subdivide does
+        x_center = (nx_min[sel] + nx_max[sel]) / 2.0
+        y_center = (ny_min[sel] + ny_max[sel]) / 2.0
+        left = (digit & 1) == 0
+        top = (digit & 2) == 0
+        nx_min[sel] = np.where(left, nx_min[sel], x_center)
+        nx_max[sel] = np.where(left, x_center, nx_max[sel])
+        ny_min[sel] = np.where(top, ny_min[sel], y_center)
+        ny_max[sel] = np.where(top, y_center, ny_max[sel])
+    return bounds
+
+
+class ArrayIndex(object):
+    def __init__(self, x_min, y_min, x_max, y_max, max_depth=4):
+        if x_min > x_max:
+            raise ValueError("x_min cannot be greater than x_max")
+        if y_min > y_max:
+            raise ValueError("y_min cannot be greater than y_max")
+        if max_depth < 0:
+            raise ValueError("max_depth cannot be less than 0")
+        if max_depth > MAX_DEPTH:
+            raise ValueError("max_depth cannot be greater than {0}"
+                             .format(MAX_DEPTH))
+        self.max_depth = max_depth
+        self.bounds = (x_min, y_min, x_max, y_max)
+        self.build(np.empty((0, 4)))
+
+    @classmethod
+    def from_node(cls, node, ids=None):
+        """Returns index holding bounds of all children of Node tree.
+
+        Children get ids of their positions in node.get_children() unless
+        `ids` are passed. Trees deeper than MAX_DEPTH are cut at it, which
+        doesn't change query results.
+        """
+        x_min, y_min, x_max, y_max = node.loose_bounds
+        index = cls(x_min, y_min, x_max, y_max,
+                    min(node.max_depth, MAX_DEPTH))
+        index.build([ch.bounds for ch in node.get_children()], ids)
+        return index
+
+    def _keys(self, paths, depths):
+        return ((paths << (2 * (self.max_depth - depths))) * 32) + depths
+
+    def build(self, item_bounds, ids=None):
+        """Replaces index contents with items given as (n, 4) bounds.
+
+        Items get ids 0..n-1 in the given order unless `ids` are passed.
+        """
+        item_bounds = _as_bounds_array(item_bounds)
+        n = item_bounds.shape[1]
+        if ids is None:
+            ids = np.arange(n, dtype=np.int64)
+        else:
+            ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+            if ids.shape[0] != n:
+                raise ValueError("number of ids must match number of bounds")
+
+        # sort items by the depth-first order of nodes they belong to, stable
+        # sort keeps insertion order within a node just like Node does
+        paths, depths = locate(item_bounds, self.bounds, self.max_depth)
+        item_keys = self._keys(paths, depths)
+        order = np.argsort(item_keys, kind='mergesort')
+        item_keys = item_keys[order]
+        paths, depths = paths[order], depths[order]
+
+        # every node holding items, plus all their ancestors
+        node_paths = [np.zeros(1, dtype=np.int64)]
+        node_depths = [np.zeros(1, dtype=np.int64)]
+        for depth in range(1, int(depths.max()) + 1 if n else 1):
+            deeper = depths >= depth
+            prefixes = np.unique(
+                paths[deeper] >> (2 * (depths[deeper] - depth)))
+            node_paths.append(prefixes)
+            node_depths.append(np.full(prefixes.shape, depth, dtype=np.int64))
+        node_paths = np.concatenate(node_paths)
+        node_depths = np.concatenate(node_depths)
+        node_keys = self._keys(node_paths, node_depths)
+        node_order = np.argsort(node_keys)
+        node_keys = node_keys[node_order]
+        node_paths = node_paths[node_order]
+        node_depths = node_depths[node_order]
+
+        m = node_keys.shape[0]
+        children = np.full((m, 4), -1, dtype=np.int64)
+        sub = np.flatnonzero(node_depths > 0)
+        parent_keys = self._keys(node_paths[sub] >> 2, node_depths[sub] - 1)
+        children[np.searchsorted(node_keys, parent_keys),
+                 node_paths[sub] & 3] = sub
+
+        subtree_keys = ((node_paths + 1) <<
+                        (2 * (self.max_depth - node_depths))) * 32
+
+        self._item_bounds = np.ascontiguousarray(item_bounds[:, order])
+        self._item_ids = ids[order]
+        self._node_bounds = path_bounds(node_paths, node_depths, self.bounds)
+        self._node_children = children
+        self._node_start = np.searchsorted(item_keys, node_keys, 'left')
+        self._node_end = np.searchsorted(item_keys, node_keys, 'right')
+        self._node_subtree_end = np.searchsorted(item_keys, subtree_keys)
+
+    def __len__(self):
+        return self._item_ids.shape[0]
+
+    def get_children(self):
+        return self._item_ids.copy()
+
+    def _query(self, bounds, enclose):
+        x_min, y_min, x_max, y_max = fix_bounds(bounds)
+        whole, partial = [], []
+        frontier = np.zeros(1, dtype=np.int64)
+        while frontier.size:
+            nx_min, ny_min, nx_max, ny_max = self._node_bounds[:, frontier]
+            hit = ((nx_min <= x_max) & (nx_max >= x_min) &
+                   (ny_min <= y_max) & (ny_max >= y_min))
+            frontier = frontier[hit]
+            covered = ((nx_min[hit] >= x_min) & (nx_max[hit] <= x_max) &
+                       (ny_min[hit] >= y_min) & (ny_max[hit] <= y_max))
+            whole.append(frontier[covered])
+            frontier = frontier[~covered]
+            partial.append(frontier)
+            frontier = self._node_children[frontier].ravel()
+            frontier = frontier[frontier >= 0]
+
+        # entire node is enclosed, take everything in its subtree
+        whole = np.concatenate(whole)
+        found = _ranges(self._node_start[whole], self._node_subtree_end[whole])
+
+        # node is partially overlapped, test its direct items
+        partial = np.concatenate(partial)
+        candidates = _ranges(self._node_start[partial],
+                             self._node_end[partial])
+        ix_min, iy_min, ix_max, iy_max = self._item_bounds[:, candidates]
+        if enclose:
+            mask = ((ix_min >= x_min) & (ix_max <= x_max) &
+                    (iy_min >= y_min) & (iy_max <= y_max))
+        else:
+            mask = ((ix_min <= x_max) & (ix_max >= x_min) &
+                    (iy_min <= y_max) & (iy_max >= y_min))
+
+        return self._item_ids[np.concatenate((found, candidates[mask]))]
+
+    def get_enclosed_children(self, within_bounds):
+        return self._query(within_bounds, True)
+
+    def get_overlapped_children(self, bounds):
+        return self._query(bounds, False)
+
+    def get_children_under_point(self, x, y):
+        return self._query((x, y, x, y), False)
+
+    def query_many(self, bounds_list, mode='overlap'):
+        """Runs get_overlapped_children (mode 'overlap') or
+        get_enclosed_children (mode 'enclose') for each of (n, 4) bounds.
+
+        Returns (offsets, ids) arrays, results for i-th bounds are
+        ids[offsets[i]:offsets[i + 1]]. All queries descend the tree
+        together, a level at a time, as (query, node) pairs.
+        """
+        if mode not in ('overlap', 'enclose'):
+            raise ValueError("mode must be 'overlap' or 'enclose'")
+        x_min, y_min, x_max, y_max = _as_bounds_array(bounds_list)
+        n = x_min.shape[0]
+        if not n:
+            return np.zeros(1, dtype=np.int64), _empty_ids.copy()
+        whole_q, whole_n, partial_q, partial_n = [], [], [], []
+        queries = np.arange(n, dtype=np.int64)
+        nodes = np.zeros(n, dtype=np.int64)
+        while queries.size:
+            nx_min, ny_min, nx_max, ny_max = self._node_bounds[:, nodes]
+            qx_min, qy_min = x_min[queries], y_min[queries]
+            qx_max, qy_max = x_max[queries], y_max[queries]
+            hit = ((nx_min <= qx_max) & (nx_max >= qx_min) &
+                   (ny_min <= qy_max) & (ny_max >= qy_min))
+            covered = ((nx_min >= qx_min) & (nx_max <= qx_max) &
+                       (ny_min >= qy_min) & (ny_max <= qy_max))[hit]
+            queries, nodes = queries[hit], nodes[hit]
+            whole_q.append(queries[covered])
+            whole_n.append(nodes[covered])
+            queries, nodes = queries[~covered], nodes[~covered]
+            partial_q.append(queries)
+            partial_n.append(nodes)
+            queries = np.repeat(queries, 4)
+            nodes = self._node_children[nodes].ravel()
+            queries, nodes = queries[nodes >= 0], nodes[nodes >= 0]
+
+        # entire node is enclosed, take everything in its subtree
+        whole_n = np.concatenate(whole_n)
+        starts = self._node_start[whole_n]
+        ends = self._node_subtree_end[whole_n]
+        found = _ranges(starts, ends)
+        found_q = np.repeat(np.concatenate(whole_q), ends - starts)
+
+        # node is partially overlapped, test its direct items
+        partial_n = np.concatenate(partial_n)
+        starts = self._node_start[partial_n]
+        ends = self._node_end[partial_n]
+        candidates = _ranges(starts, ends)
+        candidates_q = np.repeat(np.concatenate(partial_q), ends - starts)
+        ix_min, iy_min, ix_max, iy_max = self._item_bounds[:, candidates]
+        qx_min, qy_min = x_min[candidates_q], y_min[candidates_q]
+        qx_max, qy_max = x_max[candidates_q], y_max[candidates_q]
+        if mode == 'enclose':
+            mask = ((ix_min >= qx_min) & (ix_max <= qx_max) &
+                    (iy_min >= qy_min) & (iy_max <= qy_max))
+        else:
+            mask = ((ix_min <= qx_max) & (ix_max >= qx_min) &
+                    (iy_min <= qy_max) & (iy_max >= qy_min))
+
+        items = np.concatenate((found, candidates[mask]))
+        owners = np.concatenate((found_q, candidates_q[mask]))
+        order = np.argsort(owners, kind='mergesort')
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners, minlength=n), out=offsets[1:])
+        return offsets, self._item_ids[items[order]]
+
+    def _nbytes(self):
+        return _HEADER_SIZE + sum(getattr(self, name).nbytes
+                                  for name, _, _ in _ARRAYS)
+
+    def _write(self, buf):
+        """Writes flat layout of the index into writable buffer."""
+        header = np.frombuffer(buf, np.uint8, _HEADER_SIZE)
+        header[:len(_MAGIC)] = np.frombuffer(_MAGIC, np.uint8)
+        values = np.frombuffer(buf, np.int64, 4, len(_MAGIC))
+        values[:] = (FORMAT_VERSION, self.max_depth, len(self),
+                     self._get_number_of_nodes())
+        bounds = np.frombuffer(buf, np.float64, 4, len(_MAGIC) + 4 * 8)
+        bounds[:] = self.bounds
+        offset = _HEADER_SIZE
+        for name, dtype, _ in _ARRAYS:
+            array = getattr(self, name)
+            view = np.frombuffer(buf, dtype, array.size, offset)
+            view[:] = array.ravel()
+            offset += array.nbytes
+
+    @classmethod
+    def _from_buffer(cls, buf):
+        """Returns index whose arrays are read-only views into buffer holding
+        flat layout written by _write."""
+        if len(buf) < _HEADER_SIZE or bytes(buf[:len(_MAGIC)]) != _MAGIC:
+            raise ValueError("not an ArrayIndex")
+        version, max_depth, n, m = np.frombuffer(buf, np.int64, 4,
+                                                 len(_MAGIC))
+        if version != FORMAT_VERSION:
+            raise ValueError("unsupported ArrayIndex format version {0}"
+                             .format(version))
+        size = _HEADER_SIZE + sum(np.dtype(dtype).itemsize *
+                                  int(np.prod(shape(int(n), int(m))))
+                                  for _, dtype, shape in _ARRAYS)
+        if len(buf) < size:
+            raise ValueError("ArrayIndex data is truncated")
+        bounds = np.frombuffer(buf, np.float64, 4, len(_MAGIC) + 4 * 8)
+        index = cls.__new__(cls)
+        index.max_depth = int(max_depth)
+        index.bounds = tuple(float(b) for b in bounds)
+        offset = _HEADER_SIZE
+        for name, dtype, shape in _ARRAYS:
+            shape = shape(int(n), int(m))
+            view = np.frombuffer(buf, dtype, int(np.prod(shape)), offset)
+            view = view.reshape(shape)
+            view.flags.writeable = False
+            setattr(index, name, view)
+            offset += view.nbytes
+        index._buffer = buf  # keeps the memory mapped while index is alive
+        return index
+
+    def _write_file(self, path, flags, mode=0o666):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | flags, mode)
+        try:
+            size = self._nbytes()
+            os.ftruncate(fd, size)
+            buf = memory_map(fd, size)
+        finally:
+            os.close(fd)
+        try:
+            self._write(buf)
+        finally:
+            buf.close()
+
+    def save(self, path):
+        """Writes the index into file at path, replacing it if it exists."""
+        self._write_file(path, os.O_TRUNC)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Returns read-only index saved into file at path.
+
+        With mmap the file is memory-mapped, so loading takes constant time
+        and the data is read by the OS only when queries need it; otherwise
+        the whole file is read into memory.
+        """
+        with open(path, 'rb') as f:
+            if not mmap:
+                return cls._from_buffer(bytearray(f.read()))
+            if not os.fstat(f.fileno()).st_size:
+                raise ValueError("not an ArrayIndex")
+            buf = memory_map(f.fileno(), 0, access=ACCESS_READ)
+        return cls._from_buffer(buf)
+
+    def share(self, name):
+        """Copies the index into shared memory block called name (which must
+        not exist yet), from where other processes can `attach` it."""
+        self._write_file(_shared_path(name), os.O_EXCL, 0o600)
+
+    @classmethod
+    def attach(cls, name):
+        """Returns read-only index backed by shared memory block created by
+        `share`, no data is copied."""
+        return cls.load(_shared_path(name))
+
+    def _get_number_of_nodes(self):
+        # for testing and debug
+        return self._node_children.shape[0]
+
+    def __repr__(self):
+        params = [str(p) for p in list(self.bounds) + [self.max_depth]]
+        return "{0}({1})".format(self.__class__.__name__, ', '.join(params))
@@ -0,0 +1,126 @@
+"""
+Caching results of repeated queries.
+
+`CachedTree` wraps a tree and keeps results of the last `max_size` distinct
+queries (least recently used ones are evicted). Changes made through the
+wrapper drop only cached results of queries overlapping the nodes that
+held or now hold the changed children, other results stay cached. Since
+children can move only within the node holding them, a cached result is
+exactly what a new query would return, in the same order. The exceptions
+are trees with `bucket_capacity`, where splitting and merging nodes can
+change the order (but not the set) of children in cached results.
+
+Changes of children in the root node (those crossing the root's center
+lines or not fitting the tree) and root growth drop all cached results.
+Changes must go through the wrapper, the cache doesn't see changes made
+directly to the tree.
+"""
+from collections import OrderedDict
+
+from quadtree import fix_bounds, overlaps
+
+
+class CachedTree(object):
+    def __init__(self, node, max_size=256):
+        if max_size < 1:
+            raise ValueError("max_size cannot be less than 1")
+        self.node = node
+        self.max_size = max_size
+        self._results = OrderedDict()  # (kind, bounds) -> children
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # results dropped to make room for new ones
+        self.invalidations = 0  # results dropped because of changes
+
+    def __len__(self):
+        return len(self.node)
+
+    def stats(self):
+        return {'size': len(self._results), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'invalidations': self.invalidations}
+
+    def _cached(self, key, query, *args):
+        results = self._results
+        found = results.pop(key, None)
+        if found is None:
+            self.misses += 1
+            found = query(*args)
+            if len(results) >= self.max_size:
+                results.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+        results[key] = found  # most recently used go last
+        return list(found)
+
+    def get_overlapped_children(self, bounds):
+        bounds = fix_bounds(bounds)
+        return self._cached(('overlap', bounds),
+                            self.node.get_overlapped_children, bounds)
+
+    def get_enclosed_children(self, within_bounds):
+        bounds = fix_bounds(within_bounds)
+        return self._cached(('enclose', bounds),
+                            self.node.get_enclosed_children, bounds)
+
+    def get_children_under_point(self, x, y):
+        return self._cached(('point', (x, y, x, y)),
+                            self.node.get_children_under_point, x, y)
+
+    # changes
+
+    def _holder_bounds(self, children):
+        """Returns loose bounds of nodes holding children, None stands for
+        the root (changes there affect any query)."""
+        return [None if ch.qt_data[0].parent is None
+                else ch.qt_data[0].loose_bounds for ch in children]
+
+    def _invalidate(self, regions, root_bounds):
+        results = self._results
+        if None in regions or self.node.bounds != root_bounds:
+            self.invalidations += len(results)
+            results.clear()
+            return
+        regions = set(regions)
+        dropped = [key for key in results
+                   if any(overlaps(key[1], r) for r in regions)]
+        for key in dropped:
+            del results[key]
+        self.invalidations += len(dropped)
+
+    def insert(self, child):
+        root_bounds = self.node.bounds
+        self.node.insert(child)
+        self._invalidate(self._holder_bounds([child]), root_bounds)
+
+    def insert_many(self, children):
+        children = list(children)
+        root_bounds = self.node.bounds
+        self.node.insert_many(children)
+        self._invalidate(self._holder_bounds(children), root_bounds)
+
+    def reinsert(self, child):
+        root_bounds = self.node.bounds
+        regions = self._holder_bounds([child])
+        self.node.reinsert(child)
+        self._invalidate(regions + self._holder_bounds([child]), root_bounds)
+
+    def move_many(self, moves):
+        moves = list(moves)
+        children = [child for child, _ in moves]
+        root_bounds = self.node.bounds
+        regions = self._holder_bounds(children)
+        self.node.move_many(moves)
+        self._invalidate(regions + self._holder_bounds(children), root_bounds)
+
+    def remove(self, child):
+        root_bounds = self.node.bounds
+        regions = self._holder_bounds([child])
+        self.node.remove(child)
+        self._invalidate(regions, root_bounds)
+
+    def clear(self):
+        self.node.clear()
+        self.invalidations += len(self._results)
+        self._results.clear()
@@ -0,0 +1,119 @@
+"""
+Quadtree keyed by ids.
+
+`Index` stores (id, bounds) pairs instead of objects exposing `bounds` and
+`qt_data`: ids can be any hashable values (ints, tuples, ...) and queries
+return ids. The tree keeps its own id -> entry table, entries are small
+slotted records put into an ordinary `quadtree.Node` tree.
+"""
+from quadtree import Node, fix_bounds
+
+
+class _Entry(object):
+    __slots__ = ('id', 'bounds', 'qt_data')
+
+    def __init__(self, id, bounds):
+        self.id = id
+        self.bounds = bounds
+        self.qt_data = None
+
+    def __reduce__(self):
+        # qt_data is set again when the tree holding entry is unpickled
+        return _Entry, (self.id, self.bounds)
+
+
+def _ids(entries):
+    return [e.id for e in entries]
+
+
+class Index(object):
+    def __init__(self, x_min, y_min, x_max, y_max, max_depth=4, **kwargs):
+        """Other keyword arguments (grow, looseness, ...) are passed to the
+        root Node."""
+        self.tree = Node(x_min, y_min, x_max, y_max, max_depth, **kwargs)
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, id):
+        return id in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def get_bounds(self, id):
+        return self._entries[id].bounds
+
+    def insert(self, id, bounds):
+        if id in self._entries:
+            raise ValueError("id {0!r} is already in index".format(id))
+        entry = self._entries[id] = _Entry(id, fix_bounds(bounds))
+        self.tree.insert(entry)
+
+    def insert_many(self, items):
+        """Inserts (id, bounds) pairs, see Node.insert_many."""
+        entries = [_Entry(id, fix_bounds(bounds)) for id, bounds in items]
+        added = {}
+        for entry in entries:
+            if entry.id in self._entries or entry.id in added:
+                raise ValueError(
+                    "id {0!r} is already in index".format(entry.id))
+            added[entry.id] = entry
+        self._entries.update(added)
+        self.tree.insert_many(entries)
+
+    def move(self, id, bounds):
+        entry = self._entries[id]
+        entry.bounds = bounds
+        self.tree.reinsert(entry)
+
+    def move_many(self, moves):
+        """Moves are (id, new_bounds) pairs, see Node.move_many."""
+        entries = self._entries
+        self.tree.move_many((entries[id], bounds) for id, bounds in moves)
+
+    def remove(self, id):
+        self.tree.remove(self._entries.pop(id))
+
+    def clear(self):
+        self.tree.clear()
+        self._entries = {}
+
+    def get_children(self):
+        return _ids(self.tree.get_children())
+
+    def get_enclosed_children(self, within_bounds):
+        return _ids(self.tree.get_enclosed_children(within_bounds))
+
+    def get_overlapped_children(self, bounds):
+        return _ids(self.tree.get_overlapped_children(bounds))
+
+    def get_children_under_point(self, x, y):
+        return _ids(self.tree.get_children_under_point(x, y))
+
+    def query_many(self, bounds_list, mode='overlap'):
+        """Returns (offsets, ids), see Node.query_many."""
+        offsets, entries = self.tree.query_many(bounds_list, mode)
+        return offsets, _ids(entries)
+
+    def count_enclosed(self, within_bounds):
+        return self.tree.count_enclosed(within_bounds)
+
+    def count_overlapped(self, bounds):
+        return self.tree.count_overlapped(bounds)
+
+    def nearest(self, x, y, k=1):
+        return _ids(self.tree.nearest(x, y, k))
+
+    def within_radius(self, x, y, radius):
+        return _ids(self.tree.within_radius(x, y, radius))
+
+    def overlapping_pairs(self):
+        for a, b in self.tree.overlapping_pairs():
+            yield a.id, b.id
+
+    def __repr__(self):
+        params = [str(p) for p in list(self.tree.bounds) +
+                  [self.tree.max_depth]]
+        return "{0}({1})".format(self.__class__.__name__, ', '.join(params))
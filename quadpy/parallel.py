@@ -0,0 +1,86 @@
+"""
+Querying in worker processes.
+
+Objects stored in a tree can't be shared with other processes, so workers
+only ever get bounds: `QueryPool` gives every worker its own copy of the
+tree's layout holding positions of children in `Node.get_children` order,
+and splits batches of queries among workers; positions are mapped back to
+children by the calling process.
+
+Trees are built by the calling process only: most of the time of
+`Node.insert_many` goes to creating nodes and setting children's qt_data,
+which can't be done by workers.
+"""
+from array import array
+from multiprocessing import Pool, cpu_count
+
+from index import Index
+
+
+def _chunks(items, n):
+    """Splits items into at most n contiguous chunks of similar size."""
+    size = max(1, -(-len(items) // n))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# tree copy of the worker process, set by _init_worker
+_index = None
+
+
+def _init_worker(bounds, max_depth, looseness, item_bounds):
+    global _index
+    _index = Index(*(bounds + (max_depth,)), looseness=looseness)
+    _index.insert_many(enumerate(item_bounds))
+
+
+def _query_many(args):
+    bounds_list, mode = args
+    offsets, positions = _index.query_many(bounds_list, mode)
+    # query results are in get_children order, so are sorted positions
+    positions = array('L', [p for start, end in zip(offsets, offsets[1:])
+                            for p in sorted(positions[start:end])])
+    # arrays are pickled as lists, their bytes are much smaller
+    return array('L', offsets).tostring(), positions.tostring()
+
+
+def _from_string(data):
+    items = array('L')
+    items.fromstring(data)
+    return items
+
+
+class QueryPool(object):
+    """Worker processes answering queries about a snapshot of a tree.
+
+    Changes made to the tree after creating the pool are not seen by it.
+    """
+    def __init__(self, node, processes=None):
+        self.processes = processes or cpu_count()
+        self.children = node.get_children()
+        item_bounds = [ch.bounds for ch in self.children]
+        self.pool = Pool(self.processes, _init_worker,
+                         (node.bounds, node.max_depth, node.looseness,
+                          item_bounds))
+
+    def query_many(self, bounds_list, mode='overlap'):
+        """Returns (offsets, children) just like Node.query_many."""
+        if mode not in ('overlap', 'enclose'):
+            raise ValueError("mode must be 'overlap' or 'enclose'")
+        chunks = _chunks(list(bounds_list), self.processes * 4)
+        offsets, children = [0], []
+        for chunk_offsets, positions in self.pool.map(
+                _query_many, [(chunk, mode) for chunk in chunks]):
+            base = offsets[-1]
+            offsets.extend(base + o for o in _from_string(chunk_offsets)[1:])
+            children.extend(self.children[p] for p in _from_string(positions))
+        return offsets, children
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
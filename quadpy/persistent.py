@@ -0,0 +1,215 @@
+"""
+Persistent (immutable) quadtree.
+
+`PersistentTree` never changes once created: `insert`, `remove` and
+`reinsert` return a new tree that shares every node with the old one except
+for those on the path from root to the changed node. Children of a node are
+kept in a linked list, newest first, shared between versions too: `insert`
+adds one cell, so it costs O(max_depth) time and memory, while `remove` finds
+the child by scanning its node and copies the cells of children added to the
+node after it. Old versions stay fully queryable.
+
+Children are put into the same cells as `quadtree.Node` (with default
+options) would put them, but nodes are created only where there are
+children. Trees don't set anything on children: they keep children's bounds
+as they were when inserted, so children may be moved without affecting old
+versions, and `remove` / `reinsert` are told the bounds under which the
+child was inserted (child's current bounds by default). Unlike in Node,
+children not fitting the tree are tested by every query, so results never
+depend on whether a query overlaps the tree.
+"""
+from quadtree import fix_bounds, fits, quadrant_bounds, quadrant_path
+
+
+class _PNode(object):
+    # entries is None or (child, bounds, entries) cell of a linked list,
+    # newest child first; quadrants is None or 4-tuple of nodes or Nones,
+    # count is number of children in the whole sub-tree
+    __slots__ = ('bounds', 'entries', 'quadrants', 'count')
+
+    def __init__(self, bounds, entries, quadrants, count):
+        self.bounds = bounds
+        self.entries = entries
+        self.quadrants = quadrants
+        self.count = count
+
+
+def _entries(cell):
+    """Returns (child, bounds) pairs of linked entries, oldest first."""
+    pairs = []
+    while cell is not None:
+        child, bounds, cell = cell
+        pairs.append((child, bounds))
+    pairs.reverse()
+    return pairs
+
+
+def _collect(node, found):
+    """Appends all children of node's sub-tree to found, depth-first."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        found.extend(ch for ch, _ in _entries(node.entries))
+        if node.quadrants is not None:
+            stack.extend(q for q in reversed(node.quadrants) if q is not None)
+    return found
+
+
+class PersistentTree(object):
+    __slots__ = ('bounds', 'max_depth', '_root')
+
+    def __init__(self, x_min, y_min, x_max, y_max, max_depth=4, _root=None):
+        if x_min > x_max:
+            raise ValueError("x_min cannot be greater than x_max")
+        if y_min > y_max:
+            raise ValueError("y_min cannot be greater than y_max")
+        if max_depth < 0:
+            raise ValueError("max_depth cannot be less than 0")
+        self.bounds = (x_min, y_min, x_max, y_max)
+        self.max_depth = max_depth
+        if _root is None:
+            _root = _PNode(self.bounds, None, None, 0)
+        self._root = _root
+
+    def _version(self, root):
+        return PersistentTree(*(self.bounds + (self.max_depth, root)))
+
+    def _path(self, bounds):
+        # children not fitting the root stay in it, just like in Node
+        if not fits(bounds, self.bounds):
+            return ()
+        return quadrant_path(bounds, self.bounds, self.max_depth)
+
+    def _descend(self, path):
+        """Returns nodes along path, None for those that don't exist."""
+        nodes = [self._root]
+        for quadrant in path:
+            node = nodes[-1]
+            if node is None or node.quadrants is None:
+                nodes.append(None)
+            else:
+                nodes.append(node.quadrants[quadrant])
+        return nodes
+
+    def _rebuild(self, path, nodes, new, change):
+        """Returns new root with node at the end of path replaced by new,
+        copying its ancestors (whose counts change by change)."""
+        for depth in range(len(path) - 1, -1, -1):
+            parent = nodes[depth]
+            quadrants = list(parent.quadrants or (None, None, None, None))
+            quadrants[path[depth]] = new
+            count = parent.count + change
+            if not count and depth:
+                new = None  # drop emptied nodes, except root
+                continue
+            if not any(quadrants):
+                quadrants = None
+            else:
+                quadrants = tuple(quadrants)
+            new = _PNode(parent.bounds, parent.entries, quadrants, count)
+        return new
+
+    def insert(self, child, bounds=None):
+        """Returns new version with child inserted under bounds (child's
+        bounds by default)."""
+        bounds = fix_bounds(child.bounds if bounds is None else bounds)
+        path = self._path(bounds)
+        nodes = self._descend(path)
+        # create nodes missing on the path
+        node_bounds = self.bounds
+        for depth, quadrant in enumerate(path):
+            node_bounds = quadrant_bounds(node_bounds)[quadrant]
+            if nodes[depth + 1] is None:
+                nodes[depth + 1] = _PNode(node_bounds, None, None, 0)
+        target = nodes[-1]
+        new = _PNode(target.bounds, (child, bounds, target.entries),
+                     target.quadrants, target.count + 1)
+        return self._version(self._rebuild(path, nodes, new, 1))
+
+    def remove(self, child, bounds=None):
+        """Returns new version without child, which was inserted under
+        bounds (child's current bounds by default)."""
+        bounds = fix_bounds(child.bounds if bounds is None else bounds)
+        path = self._path(bounds)
+        nodes = self._descend(path)
+        target = nodes[-1]
+        # cells in front of child's one are copied, the rest is shared
+        newer = []
+        cell = target.entries if target is not None else None
+        while cell is not None and cell[0] is not child:
+            newer.append(cell)
+            cell = cell[2]
+        if cell is None:
+            raise ValueError("child not found under given bounds")
+        entries = cell[2]
+        for ch, ch_bounds, _ in reversed(newer):
+            entries = (ch, ch_bounds, entries)
+        if not (entries or target.quadrants) and path:
+            new = None
+        else:
+            new = _PNode(target.bounds, entries, target.quadrants,
+                         target.count - 1)
+        return self._version(self._rebuild(path, nodes, new, -1))
+
+    def reinsert(self, child, old_bounds, bounds=None):
+        """Returns new version with child moved from old_bounds to bounds
+        (child's current bounds by default)."""
+        return self.remove(child, old_bounds).insert(child, bounds)
+
+    def __len__(self):
+        return self._root.count
+
+    def get_children(self):
+        return _collect(self._root, [])
+
+    def get_enclosed_children(self, within_bounds):
+        return self._query(fix_bounds(within_bounds), True)
+
+    def get_overlapped_children(self, bounds):
+        return self._query(fix_bounds(bounds), False)
+
+    def get_children_under_point(self, x, y):
+        return self._query((x, y, x, y), False)
+
+    def count_enclosed(self, within_bounds):
+        return len(self.get_enclosed_children(within_bounds))
+
+    def count_overlapped(self, bounds):
+        return len(self.get_overlapped_children(bounds))
+
+    def _query(self, bounds, enclose):
+        x_min, y_min, x_max, y_max = bounds
+        found = []
+        root = self._root
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            nx_min, ny_min, nx_max, ny_max = node.bounds
+            # no overlap
+            if (nx_min > x_max or nx_max < x_min or
+                    ny_min > y_max or ny_max < y_min) and node is not root:
+                continue
+            # entire node is enclosed, take everything; root's children are
+            # always tested since it holds those not fitting the tree
+            if (nx_min >= x_min and nx_max <= x_max and
+                    ny_min >= y_min and ny_max <= y_max) and node is not root:
+                _collect(node, found)
+                continue
+            # node is partially overlapped, test its children
+            for ch, (cx_min, cy_min, cx_max, cy_max) in _entries(
+                    node.entries):
+                if enclose:
+                    if (cx_min >= x_min and cx_max <= x_max and
+                            cy_min >= y_min and cy_max <= y_max):
+                        found.append(ch)
+                elif (cx_min <= x_max and cx_max >= x_min and
+                        cy_min <= y_max and cy_max >= y_min):
+                    found.append(ch)
+            if node.quadrants is not None:
+                stack.extend(q for q in reversed(node.quadrants)
+                             if q is not None)
+        return found
+
+    def __repr__(self):
+        params = [str(p) for p in list(self.bounds) + [self.max_depth]]
+        return "{0}({1})".format(self.__class__.__name__, ', '.join(params))
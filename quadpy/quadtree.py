@@ -28,6 +28,13 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 ------------------------------------------------------------------------------
 """
+import gc
+from array import array
+from heapq import heappush, heappop
+from itertools import count, islice
+from math import sqrt
+
+from rectangle import Rectangle
 
 
 def fits(bounds_inside, bounds_around):
@@ -56,181 +63,1293 @@ def fix_bounds(bounds):
     return (x1, y1, x2, y2)
 
 
+def distance(x, y, bounds):
+    """Returns distance from point (x, y) to the closest point of bounds."""
+    x_min, y_min, x_max, y_max = bounds
+    dx = x_min - x if x < x_min else (x - x_max if x > x_max else 0)
+    dy = y_min - y if y < y_min else (y - y_max if y > y_max else 0)
+    return sqrt(dx * dx + dy * dy)
+
+
+def loosen(bounds, looseness):
+    """Returns bounds scaled by looseness around their center."""
+    if looseness == 1:
+        return bounds
+    x_min, y_min, x_max, y_max = bounds
+    dx = (x_max - x_min) * (looseness - 1) / 2.0
+    dy = (y_max - y_min) * (looseness - 1) / 2.0
+    return (x_min - dx, y_min - dy, x_max + dx, y_max + dy)
+
+
+def quadrant_bounds(bounds):
+    """Returns bounds of quadrants of a node in order TL, TR, BL, BR."""
+    x_min, y_min, x_max, y_max = bounds
+    x_center = (x_min + x_max) / 2.0
+    y_center = (y_min + y_max) / 2.0
+    return [
+        (x_min, y_min, x_center, y_center),
+        (x_center, y_min, x_max, y_center),
+        (x_min, y_center, x_center, y_max),
+        (x_center, y_center, x_max, y_max),
+    ]
+
+
+def quadrant_path(bounds, node_bounds, max_depth, looseness=1):
+    """Returns indices of quadrants that inserting bounds would descend into.
+
+    Centers are computed the same way as in `Node.subdivide` and ties are
+    resolved in the same order as in `Node._insert` (TL, TR, BL, BR), so the
+    path leads exactly to the node that `_insert` would put the child in.
+    """
+    if looseness != 1:
+        return _loose_quadrant_path(bounds, node_bounds, max_depth, looseness)
+    x1_min, y1_min, x1_max, y1_max = bounds
+    x_min, y_min, x_max, y_max = node_bounds
+    path = []
+    for _ in range(max_depth):
+        x_center = (x_min + x_max) / 2.0
+        y_center = (y_min + y_max) / 2.0
+        if x1_max <= x_center:
+            quadrant = 0
+        elif x1_min >= x_center:
+            quadrant = 1
+        else:
+            break
+        if y1_max <= y_center:
+            pass
+        elif y1_min >= y_center:
+            quadrant += 2
+        else:
+            break
+        if quadrant & 1:
+            x_min = x_center
+        else:
+            x_max = x_center
+        if quadrant & 2:
+            y_min = y_center
+        else:
+            y_max = y_center
+        path.append(quadrant)
+    return tuple(path)
+
+
+def quadrant_paths(item_bounds, node_bounds, max_depth, looseness=1):
+    """Returns quadrant_path for each of item_bounds, or None for bounds not
+    fitting node's loose bounds (inserting keeps those in the node)."""
+    loose_bounds = loosen(node_bounds, looseness)
+    return [quadrant_path(fix_bounds(b), node_bounds, max_depth, looseness)
+            if fits(b, loose_bounds) else None for b in item_bounds]
+
+
+def without_gc(func, *args):
+    """Calls func with cyclic garbage collector disabled.
+
+    Building trees creates lots of objects but no garbage, collector passes
+    over the growing tree would dominate the run time.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return func(*args)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def center_quadrant(bounds, node_bounds):
+    """Returns index of node's quadrant containing the center of bounds."""
+    x1_min, y1_min, x1_max, y1_max = bounds
+    x_min, y_min, x_max, y_max = node_bounds
+    # compare doubled coordinates to avoid rounding child's center
+    quadrant = 1 if x1_min + x1_max >= x_min + x_max else 0
+    if y1_min + y1_max >= y_min + y_max:
+        quadrant += 2
+    return quadrant
+
+
+def _loose_quadrant_path(bounds, node_bounds, max_depth, looseness):
+    path = []
+    for _ in range(max_depth):
+        quadrant = center_quadrant(bounds, node_bounds)
+        q_bounds = quadrant_bounds(node_bounds)[quadrant]
+        if not fits(bounds, loosen(q_bounds, looseness)):
+            break
+        path.append(quadrant)
+        node_bounds = q_bounds
+    return tuple(path)
+
+
+def _pairs_with_subtrees(children, nodes):
+    """Yields (child, other) for every one of children overlapping some other
+    child in sub-trees of given nodes."""
+    stack = [(node, children) for node in nodes]
+    while stack:
+        node, candidates = stack.pop()
+        if not node.num_children:
+            continue
+        candidates = [ch for ch in candidates
+                      if overlaps(ch.bounds, node.loose_bounds)]
+        if not candidates:
+            continue
+        for other in node.direct_children:
+            for ch in candidates:
+                if overlaps(ch.bounds, other.bounds):
+                    yield ch, other
+        stack.extend((q, candidates) for q in node.quadrants)
+
+
+def _join(a, b, region=None):
+    """Yields (child, other) for every pair of overlapping children from
+    sub-trees of nodes a and b. If region is given, it must contain every
+    such overlap, and only nodes and children overlapping it are visited."""
+    stack = [(a, b)]
+    while stack:
+        a, b = stack.pop()
+        a_children, b_children = a.direct_children, b.direct_children
+        a_quadrants = [q for q in a.quadrants if q.num_children]
+        b_quadrants = [q for q in b.quadrants if q.num_children]
+        if region is not None:
+            a_children = [ch for ch in a_children
+                          if overlaps(ch.bounds, region)]
+            b_children = [ch for ch in b_children
+                          if overlaps(ch.bounds, region)]
+            a_quadrants = [q for q in a_quadrants
+                           if overlaps(q.loose_bounds, region)]
+            b_quadrants = [q for q in b_quadrants
+                           if overlaps(q.loose_bounds, region)]
+        for ch in a_children:
+            for other in b_children:
+                if overlaps(ch.bounds, other.bounds):
+                    yield ch, other
+        for pair in _pairs_with_subtrees(a_children, b_quadrants):
+            yield pair
+        for other, ch in _pairs_with_subtrees(b_children, a_quadrants):
+            yield ch, other
+        stack.extend((qa, qb) for qa in a_quadrants for qb in b_quadrants
+                     if overlaps(qa.loose_bounds, qb.loose_bounds))
+
+
+# flags describing nodes in pickled trees
+_HAS_QUADRANTS = 1
+_OWN_BOUNDS = 2  # bounds differ from quadrant_bounds of parent (grown root)
+
+
+def _unpickle_tree(*args):
+    """Rebuilds tree pickled by Node.__reduce__."""
+    return without_gc(_build_unpickled_tree, *args)
+
+
+def _build_unpickled_tree(cls, bounds, options, flags, sizes, children):
+    max_depth, grow, looseness, bucket_capacity = options
+    x_min, y_min, x_max, y_max = bounds[:4]
+    root = cls(x_min, y_min, x_max, y_max, max_depth, None, grow, looseness,
+               bucket_capacity)
+    nodes = [root]
+    # nodes come in depth-first order, stack holds nodes whose quadrants are
+    # not all created yet along with remaining quadrant bounds
+    stack = []
+    if flags[0] & _HAS_QUADRANTS:
+        stack.append((root, quadrant_bounds(root.bounds)))
+    next_bounds = 4
+    for node_flags in islice(flags, 1, None):
+        parent, remaining = stack[-1]
+        node_bounds = remaining.pop(0)
+        if not remaining:
+            stack.pop()
+        if node_flags & _OWN_BOUNDS:
+            node_bounds = tuple(bounds[next_bounds:next_bounds + 4])
+            next_bounds += 4
+        node = parent._make_node(node_bounds, parent.max_depth - 1, parent)
+        parent.quadrants.append(node)
+        nodes.append(node)
+        if node_flags & _HAS_QUADRANTS:
+            stack.append((node, quadrant_bounds(node_bounds)))
+
+    start = 0
+    for node, size in zip(nodes, sizes):
+        node.direct_children = children[start:start + size]
+        start += size
+        for i, ch in enumerate(node.direct_children):
+            set_qt_data(ch, node, i)
+    # children of sub-nodes come later in depth-first order
+    for node in reversed(nodes):
+        node.num_children += len(node.direct_children)
+        if node.parent is not None:
+            node.parent.num_children += node.num_children
+    return root
+
+
+def _unpickle_subnode(root, path):
+    """Returns sub-node of unpickled root at quadrant path."""
+    node = root
+    for quadrant in path:
+        node = node.quadrants[quadrant]
+    return node
+
+
+class QTData(object):
+    """Mutable (node, index) record kept in children's qt_data.
+
+    Behaves like a (node, index) tuple, but is updated in place when a child
+    moves instead of creating a new tuple each time.
+    """
+    __slots__ = ('node', 'index')
+
+    def __init__(self, node, index):
+        self.node = node
+        self.index = index
+
+    def __getitem__(self, i):
+        return (self.node, self.index)[i]
+
+    def __iter__(self):
+        yield self.node
+        yield self.index
+
+    def __len__(self):
+        return 2
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # node is left out, unpickled trees point records to their new nodes
+        return QTData, (None, self.index)
+
+    def __repr__(self):
+        return "{0}({1!r}, {2})".format(self.__class__.__name__, self.node,
+                                        self.index)
+
+
+def set_qt_data(child, node, index):
+    """Points child's qt_data to index in node, reusing existing record."""
+    data = getattr(child, 'qt_data', None)
+    if data.__class__ is QTData:
+        data.node = node
+        data.index = index
+    else:
+        child.qt_data = QTData(node, index)
+
+
+# how a node's sub-tree relates to a query: no child of it overlaps the query,
+# all of them do (node is enclosed) or its children must be tested one by one
+_NONE, _ALL, _SOME = 0, 1, 2
+
+
+def _coverage(node, bounds):
+    loose_bounds = node.loose_bounds
+    if not overlaps(bounds, loose_bounds):
+        return _NONE
+    if fits(loose_bounds, bounds):
+        return _ALL
+    return _SOME
+
+
+class Viewport(object):
+    """Children of a tree overlapping a rectangle that moves around.
+
+    `move` returns children that entered and left the rectangle, visiting
+    only nodes that are not entirely inside (or entirely outside) both old
+    and new rectangle, so small moves cost time proportional to the change
+    instead of to the number of visible children. Visible children are the
+    same as get_overlapped_children would give. Moves assume the tree didn't
+    change since the previous move, after changing it call `refresh`.
+    """
+    def __init__(self, node, bounds):
+        self.node = node
+        self.bounds = fix_bounds(bounds)
+        # children are keyed by id, they may be unhashable or hash by bounds
+        self._visible = dict((id(ch), ch) for ch in
+                             node.get_overlapped_children(self.bounds))
+
+    def __len__(self):
+        return len(self._visible)
+
+    def get_children(self):
+        return list(self._visible.values())
+
+    def move(self, bounds):
+        """Moves viewport to bounds, returns (entered, exited) lists."""
+        old, new = self.bounds, fix_bounds(bounds)
+        entered, exited = [], []
+        stack = [self.node]
+        while stack:
+            node = stack.pop()
+            in_old, in_new = _coverage(node, old), _coverage(node, new)
+            if in_old == in_new and in_old != _SOME:
+                continue
+            if in_old != _SOME and in_new != _SOME:
+                # whole sub-tree entered or left
+                (entered if in_new == _ALL else exited).extend(
+                    node.get_children())
+                continue
+            for ch in node.direct_children:
+                was = in_old == _ALL or (in_old == _SOME and
+                                         overlaps(ch.bounds, old))
+                now = in_new == _ALL or (in_new == _SOME and
+                                         overlaps(ch.bounds, new))
+                if now and not was:
+                    entered.append(ch)
+                elif was and not now:
+                    exited.append(ch)
+            stack.extend([q for q in node.quadrants[::-1] if q.num_children])
+
+        self.bounds = new
+        visible = self._visible
+        for ch in exited:
+            del visible[id(ch)]
+        for ch in entered:
+            visible[id(ch)] = ch
+        return entered, exited
+
+    def refresh(self):
+        """Queries the tree again, returns (entered, exited) lists of
+        children that changed visibility since the last move."""
+        found = dict((id(ch), ch) for ch in
+                     self.node.get_overlapped_children(self.bounds))
+        entered = [ch for key, ch in found.items()
+                   if key not in self._visible]
+        exited = [ch for key, ch in self._visible.items()
+                  if key not in found]
+        self._visible = found
+        return entered, exited
+
+
+class NodePool(object):
+    """Keeps nodes dropped from trees while cleaning up, so they can be reused
+    when subdividing instead of creating new ones.
+
+    Pass it to root node as `pool` argument, the same pool can be shared by
+    many trees. Up to max_size nodes are kept (no limit if None).
+    """
+    def __init__(self, max_size=None):
+        if max_size is not None and max_size < 0:
+            raise ValueError("max_size cannot be less than 0")
+        self.max_size = max_size
+        self.free = []
+        self.created = 0  # nodes created because pool was empty
+        self.reused = 0  # nodes taken from pool
+        self.released = 0  # nodes put into pool
+        self.discarded = 0  # nodes not put into pool since it was full
+
+    def __len__(self):
+        return len(self.free)
+
+    def stats(self):
+        return {'size': len(self.free), 'created': self.created,
+                'reused': self.reused, 'released': self.released,
+                'discarded': self.discarded}
+
+    def _release(self, node):
+        if self.max_size is not None and len(self.free) >= self.max_size:
+            self.discarded += 1
+            return
+        node.parent = None
+        self.free.append(node)
+        self.released += 1
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__, self.max_size)
+
+
 class Node(object):
-    def __init__(self, x_min, y_min, x_max, y_max, max_depth=4, parent=None):
+    __slots__ = ('bounds', 'loose_bounds', 'max_depth', 'parent',
+                 'direct_children', 'quadrants', 'num_children', 'grow',
+                 'looseness', 'bucket_capacity', 'pool')
+
+    def __init__(self, x_min, y_min, x_max, y_max, max_depth=4, parent=None,
+                 grow=False, looseness=1, bucket_capacity=None, pool=None):
         if x_min > x_max:
             raise ValueError("x_min cannot be greater than x_max")
         if y_min > y_max:
             raise ValueError("y_min cannot be greater than y_max")
         if max_depth < 0:
             raise ValueError("max_depth cannot be less than 0")
-        self.x_min = x_min
-        self.y_min = y_min
-        self.x_max = x_max
-        self.y_max = y_max
+        if looseness < 1:
+            raise ValueError("looseness cannot be less than 1")
+        if bucket_capacity is not None and bucket_capacity < 1:
+            raise ValueError("bucket_capacity cannot be less than 1")
         self.max_depth = max_depth
         self.direct_children = []
         self.quadrants = []
         self.parent = parent
         self.bounds = (x_min, y_min, x_max, y_max)
+        # number of children in this node and all its sub-nodes
+        self.num_children = 0
+        # if True, root node grows to fit children inserted outside of it
+        self.grow = grow
+        # children are accepted by a node if they fit its loose bounds, which
+        # are node's bounds scaled by looseness around their center; with
+        # looseness > 1 children that cross quadrant borders near the center
+        # can still be put into quadrants instead of staying in this node
+        self.looseness = looseness
+        self.loose_bounds = loosen(self.bounds, looseness)
+        # if set, nodes are subdivided only when they hold more children than
+        # this, and merged back when their sub-tree holds less than half of
+        # it; otherwise nodes are subdivided down to max_depth on insert
+        self.bucket_capacity = bucket_capacity
+        # NodePool that sub-nodes are taken from and returned to, if any
+        self.pool = pool
+
+    def __copy__(self):
+        # children keep a single qt_data, so they can't be shared by two trees
+        raise TypeError("Node can't be copied shallowly, use copy.deepcopy")
+
+    def __reduce__(self):
+        """Pickles the whole tree as a few flat arrays instead of nested
+        nodes, sub-nodes are pickled as their root and quadrant path.
+
+        Children are pickled as they are, except for their qt_data, which
+        points to the new nodes after unpickling. Pool is not pickled.
+        """
+        if self.parent is not None:
+            path = []
+            node = self
+            while node.parent is not None:
+                path.append(node.parent.quadrants.index(node))
+                node = node.parent
+            return _unpickle_subnode, (node, tuple(reversed(path)))
+
+        bounds = array('d', self.bounds)
+        flags = array('B')
+        sizes = array('L')
+        children = []
+        stack = [(self, None)]
+        while stack:
+            node, expected_bounds = stack.pop()
+            node_flags = 0
+            if node.quadrants:
+                node_flags |= _HAS_QUADRANTS
+            if expected_bounds is not None and node.bounds != expected_bounds:
+                node_flags |= _OWN_BOUNDS
+                bounds.extend(node.bounds)
+            flags.append(node_flags)
+            sizes.append(len(node.direct_children))
+            children.extend(node.direct_children)
+            if node.quadrants:
+                stack.extend(reversed(zip(node.quadrants,
+                                          quadrant_bounds(node.bounds))))
+        options = (self.max_depth, self.grow, self.looseness,
+                   self.bucket_capacity)
+        return _unpickle_tree, (self.__class__, bounds, options, flags,
+                                sizes, children)
+
+    # sides are kept only in bounds
+    x_min = property(lambda self: self.bounds[0])
+    y_min = property(lambda self: self.bounds[1])
+    x_max = property(lambda self: self.bounds[2])
+    y_max = property(lambda self: self.bounds[3])
+
+    def _make_node(self, bounds, max_depth, parent):
+        """Returns new node with the same options as self."""
+        pool = self.pool
+        if pool is None:
+            return Node(*(bounds + (max_depth, parent)),
+                        looseness=self.looseness,
+                        bucket_capacity=self.bucket_capacity)
+        if not pool.free:
+            pool.created += 1
+            return Node(*(bounds + (max_depth, parent)),
+                        looseness=self.looseness,
+                        bucket_capacity=self.bucket_capacity, pool=pool)
+        # released nodes are already cleared, only reset their attributes
+        pool.reused += 1
+        node = pool.free.pop()
+        node.max_depth = max_depth
+        node.parent = parent
+        node.bounds = bounds
+        node.grow = False
+        node.looseness = self.looseness
+        node.loose_bounds = loosen(bounds, self.looseness)
+        node.bucket_capacity = self.bucket_capacity
+        return node
+
+    @classmethod
+    def from_bounds(cls, item_bounds, max_depth=4, bounds=None, **kwargs):
+        """Returns new tree holding a Rectangle for each of item_bounds.
+
+        Tree bounds default to the extent of all items, other keyword
+        arguments are passed to the constructor.
+        """
+        if hasattr(item_bounds, 'tolist'):  # numpy arrays
+            item_bounds = item_bounds.tolist()
+        children = [Rectangle(*fix_bounds(b)) for b in item_bounds]
+        if bounds is None:
+            if not children:
+                raise ValueError("bounds must be given for an empty tree")
+            bounds = (min(ch.bounds[0] for ch in children),
+                      min(ch.bounds[1] for ch in children),
+                      max(ch.bounds[2] for ch in children),
+                      max(ch.bounds[3] for ch in children))
+        tree = cls(*(tuple(bounds) + (max_depth,)), **kwargs)
+        tree.insert_many(children)
+        return tree
 
     def subdivide(self):
-        x_min, y_min = self.x_min, self.y_min
-        x_max, y_max = self.x_max, self.y_max
-        x_center = (x_min + x_max) / 2.0
-        y_center = (y_min + y_max) / 2.0
         depth = self.max_depth - 1
-        self.quadrants = [
-            Node(x_min, y_min, x_center, y_center, depth, self),
-            Node(x_center, y_min, x_max, y_center, depth, self),
-            Node(x_min, y_center, x_center, y_max, depth, self),
-            Node(x_center, y_center, x_max, y_max, depth, self),
-        ]
+        self.quadrants = [self._make_node(b, depth, self)
+                          for b in quadrant_bounds(self.bounds)]
 
-    def clear(self):
+    def _split(self):
+        # subdivide and move down children that fit into new quadrants
+        children = self.direct_children
         self.direct_children = []
-        [q.clear() for q in self.quadrants]
-        self.quadrants = []
+        self._add_to_count(-len(children))
+        self.subdivide()
+        for ch in children:
+            self._insert(ch)
+
+    def _merge(self):
+        # move all children from sub-nodes into self and drop sub-nodes
+        children = self.get_children()
+        self._clear()
+        self.direct_children = children
+        self.num_children = len(children)
+        for i, ch in enumerate(children):
+            set_qt_data(ch, self, i)
+
+    def clear(self):
+        if self.parent is not None:
+            self.parent._add_to_count(-self.num_children)
+        self._clear()
+
+    def _clear(self):
+        pool = self.pool
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.quadrants)
+            node.direct_children = []
+            node.num_children = 0
+            node.quadrants = []
+            if pool is not None and node is not self:
+                pool._release(node)
+
+    def _add_to_count(self, amount):
+        node = self
+        while node is not None:
+            node.num_children += amount
+            node = node.parent
+
+    def _grow(self, bounds):
+        """Doubles the root towards bounds until they fit inside it.
+
+        Node keeps its identity, its current contents are moved to a new
+        quadrant node with the old bounds, and max_depth is incremented so
+        that the size of the smallest nodes stays the same.
+        """
+        bx_min, by_min, bx_max, by_max = fix_bounds(bounds)
+        while not fits((bx_min, by_min, bx_max, by_max), self.loose_bounds):
+            x_min, y_min, x_max, y_max = self.bounds
+            width, height = x_max - x_min, y_max - y_min
+            if not width or not height:
+                raise ValueError("cannot grow node with zero width or height")
+
+            # grow left / up only if bounds stick out on that side, so the
+            # old node becomes the right / bottom half
+            if bx_min < x_min:
+                x_min, x_center = x_min - width, x_min
+            else:
+                x_center, x_max = x_max, x_max + width
+            if by_min < y_min:
+                y_min, y_center = y_min - height, y_min
+            else:
+                y_center, y_max = y_max, y_max + height
+
+            if self.quadrants or self.direct_children:
+                inner = self._make_node(self.bounds, self.max_depth, self)
+                inner.direct_children = self.direct_children
+                inner.quadrants = self.quadrants
+                inner.num_children = self.num_children
+                for q in inner.quadrants:
+                    q.parent = inner
+                for i, ch in enumerate(inner.direct_children):
+                    set_qt_data(ch, inner, i)
+                depth = self.max_depth
+                self.quadrants = [
+                    inner if b == inner.bounds else
+                    self._make_node(b, depth, self)
+                    for b in [(x_min, y_min, x_center, y_center),
+                              (x_center, y_min, x_max, y_center),
+                              (x_min, y_center, x_center, y_max),
+                              (x_center, y_center, x_max, y_max)]]
+                self.direct_children = []
+            self.max_depth += 1
+            self.bounds = (x_min, y_min, x_max, y_max)
+            self.loose_bounds = loosen(self.bounds, self.looseness)
 
     def insert(self, child):
-        if fits(child.bounds, self.bounds):
+        if self.grow and self.parent is None:
+            self._grow(child.bounds)
+        if fits(child.bounds, self.loose_bounds):
             self._insert(child)
         else:
             self.direct_children.append(child)
-            child.qt_data = (self, len(self.direct_children) - 1)
-        # TODO: expand the quadtree
+            set_qt_data(child, self, len(self.direct_children) - 1)
+            self._add_to_count(1)
         # note from javascript version: this solutions keeps track of the
         # object, but will cause false positives when selection boundaries
-        # enclose the node
+        # enclose the node, to avoid this create the tree with grow=True
+
+    def insert_many(self, children):
+        """Inserts all children, the result is the same as calling `insert`
+        for each of them, but instead of descending the tree once per child
+        target nodes are computed up front and children are sorted by them
+        (Z-order), so every node is visited and subdivided only once."""
+        without_gc(self._insert_many, list(children))
+
+    def _insert_many(self, children):
+        if self.bucket_capacity is not None:
+            # tree shape depends on insertion order, no shortcut here
+            for child in children:
+                self.insert(child)
+            return
+        self._grow_to_fit(children)
+        self._insert_paths(children, quadrant_paths(
+            [ch.bounds for ch in children], self.bounds, self.max_depth,
+            self.looseness))
+
+    def _grow_to_fit(self, children):
+        # grow towards each child in turn, as repeated insert would, growing
+        # once to the extent of all children could give different bounds
+        if self.grow and self.parent is None:
+            for child in children:
+                self._grow(child.bounds)
+
+    def _insert_paths(self, children, paths):
+        """Puts children at the ends of their quadrant paths (computed with
+        quadrant_paths for self), children without a path stay in self."""
+        for child, path in zip(children, paths):
+            if path is not None:
+                child.bounds = fix_bounds(child.bounds)
+        # stable sort keeps insertion order of children within each node,
+        # and tuple ordering puts every node before its sub-nodes
+        order = sorted(range(len(children)),
+                       key=lambda i: paths[i] or ())
+
+        nodes = [self]  # nodes along current path
+        current = ()
+        for i in order:
+            path, child = paths[i], children[i]
+            if path and path != current:
+                common = 0
+                while (common < len(path) and common < len(current)
+                       and path[common] == current[common]):
+                    common += 1
+                del nodes[common + 1:]
+                for quadrant in path[common:]:
+                    node = nodes[-1]
+                    if not node.quadrants:
+                        node.subdivide()
+                    nodes.append(node.quadrants[quadrant])
+                current = path
+            elif not path:
+                del nodes[1:]
+                current = ()
+            node = nodes[-1]
+            # _insert tries to subdivide in any case
+            if path is not None and not node.quadrants and node.max_depth > 0:
+                node.subdivide()
+            node.direct_children.append(child)
+            set_qt_data(child, node, len(node.direct_children) - 1)
+            node._add_to_count(1)
 
     def _insert(self, child):
-        child.bounds = fix_bounds(child.bounds)
+        bounds = child.bounds = fix_bounds(child.bounds)
+        node = self
+        while True:
+            if node.bucket_capacity is not None and not node.quadrants:
+                # leaf node, subdivide only when it overflows
+                node.direct_children.append(child)
+                set_qt_data(child, node, len(node.direct_children) - 1)
+                node._add_to_count(1)
+                if (len(node.direct_children) > node.bucket_capacity
+                        and node.max_depth > 0):
+                    node._split()
+                return
 
-        # try to subdivide in any case
-        if not self.quadrants and self.max_depth > 0:
-            self.subdivide()
+            # try to subdivide in any case
+            if not node.quadrants and node.max_depth > 0:
+                node.subdivide()
 
-        # choose which sub-node to put it in
+            q = node._choose_quadrant(bounds)
+            if q is None:
+                break
+            node = q
+        # no better sub-node found, put it inside node
+        node.direct_children.append(child)
+        set_qt_data(child, node, len(node.direct_children) - 1)
+        node._add_to_count(1)
+
+    def _choose_quadrant(self, bounds):
+        """Returns quadrant that bounds should go into, or None."""
         # child must fit entirely (must not cross node's boundaries)
-        for q in self.quadrants:
-            if fits(child.bounds, q.bounds):
-                q._insert(child)
-                return
-        # no better sub-node found, put it inside self
-        self.direct_children.append(child)
-        child.qt_data = (self, len(self.direct_children) - 1)
+        x_min, y_min, x_max, y_max = bounds
+        if (self.looseness == 1 and x_min == x_max and y_min == y_max and
+                fits(bounds, self.bounds)):
+            # a point inside the node always fits the first quadrant on its
+            # side of the center lines, so it goes down by comparing with the
+            # center only (points outside the root stay in it)
+            if self.quadrants:
+                _, _, x_center, y_center = self.quadrants[0].bounds
+                return self.quadrants[(x_min > x_center) +
+                                      2 * (y_min > y_center)]
+        elif self.looseness == 1:
+            for q in self.quadrants:
+                if fits(bounds, q.bounds):
+                    return q
+        elif self.quadrants:
+            # loose quadrants overlap, pick the one containing child's center
+            q = self.quadrants[center_quadrant(bounds, self.bounds)]
+            if fits(bounds, q.loose_bounds):
+                return q
+        return None
+
+    def _holds(self, bounds):
+        """Returns True if _insert would put child with bounds into self."""
+        if not fits(bounds, self.loose_bounds):
+            return False
+        if self.quadrants:
+            return self._choose_quadrant(bounds) is None
+        if self.bucket_capacity is not None or self.max_depth == 0:
+            return True
+        # quadrants would be created by _insert
+        return not quadrant_path(bounds, self.bounds, 1, self.looseness)
 
     def reinsert(self, child):
-        parent, index = child.qt_data
-        root = parent
-        while root.parent:  # find root node
-            root = root.parent
-        parent._remove(child)
-        # have to insert from root since this 'parent' node might have been
-        # detached if 'child' was the last element in it
-        root._reinsert(child)
+        self._move(child, True)
+
+    def move_many(self, moves):
+        """Sets new bounds of children and reinserts them.
+
+        Moves are (child, new_bounds) pairs. Nodes left empty (or, in bucket
+        mode, small enough to merge) are cleaned up only once all children
+        were moved, so nodes emptied by one move and filled by another are
+        kept instead of being dropped and subdivided again.
+        """
+        touched = set()
+        for child, bounds in moves:
+            child.bounds = bounds
+            node = self._move(child, False)
+            if node is not None:
+                touched.add(node)
+        for node in touched:
+            node._try_cleanup()
+            if node.bucket_capacity is not None:
+                node._try_merge()
+
+    def _move(self, child, cleanup):
+        """Reinserts child, returns node it was removed from (None if child
+        stayed where it was)."""
+        data = child.qt_data
+        node, index = data.node, data.index
+        bounds = fix_bounds(child.bounds)
+        if node._holds(bounds):
+            # still belongs where it is
+            child.bounds = bounds
+            return None
+
+        # climb only as far as needed for new bounds to fit
+        target = node
+        while target.parent is not None and not fits(bounds,
+                                                     target.loose_bounds):
+            target = target.parent
+
+        if (target.bucket_capacity is not None
+                or not fits(bounds, target.loose_bounds)):
+            # removing might merge nodes above target in bucket mode, and
+            # bounds not fitting the root might make it grow, so remove first
+            # and insert from root (target itself might have been merged away)
+            root = target
+            while root.parent is not None:
+                root = root.parent
+            node._remove_at(index, cleanup)
+            root._reinsert(child)
+            return node
+
+        # insert first, so that removing can't detach the target node while
+        # cleaning up; old entry is then removed using saved index
+        target._insert(child)
+        node._remove_at(index, cleanup)
+        return node
 
     def _reinsert(self, child):
-        if fits(child.bounds, self.bounds) or self.parent is None:
-            self._insert(child)
-        else:
-            #if self.parent is None:
-                #raise ValueError("New child bounds don't fit in quadtree")
-            self.parent._reinsert(child)
+        # climb up until child fits, root takes it in any case
+        node = self
+        while node.parent is not None and not fits(child.bounds,
+                                                   node.loose_bounds):
+            node = node.parent
+        if node.grow and node.parent is None:
+            node._grow(child.bounds)
+        node._insert(child)
 
     def remove(self, child):
         # child has reference to parent so we don't have to search the tree
-        parent = child.qt_data[0]
-        parent._remove(child)
+        child.qt_data.node._remove(child)
 
     def _remove(self, child):
         # every child has it's index stored in qt_data so we can quickly remove
         # it, which also prevents removing wrong element when child's class
         # implements custom __eq__ which might cause removing wrong instance
+        self._remove_at(child.qt_data.index)
+
+    def _remove_at(self, index, cleanup=True):
         num_children = len(self.direct_children)
+        self._add_to_count(-1)
         if num_children > 1:
             # swap places with last element in list and remove last
-            last = self.direct_children[num_children - 1]
-            last.qt_data = child.qt_data
-            self.direct_children[child.qt_data[1]] = last
-            self.direct_children.pop()
+            last = self.direct_children.pop()
+            if index < num_children - 1:
+                set_qt_data(last, self, index)
+                self.direct_children[index] = last
         else:
             self.direct_children.pop()
-            self._try_cleanup()
+            if cleanup:
+                self._try_cleanup()
+        if cleanup and self.bucket_capacity is not None:
+            self._try_merge()
+
+    def _try_merge(self):
+        # merge the topmost ancestor whose sub-tree became small enough
+        low_water = self.bucket_capacity // 2
+        node, to_merge = self, None
+        while node is not None:
+            if node.quadrants and node.num_children < low_water:
+                to_merge = node
+            node = node.parent
+        if to_merge is not None:
+            to_merge._merge()
 
     def _try_cleanup(self):
-        # if this node and all sub-nodes are empty, clean and tell parent to
-        # attempt cleanup also since it might be empty too
-        if not self.get_children():
-            self.clear()
-            if self.parent:
-                self.parent._try_cleanup()
+        # if this node and all sub-nodes are empty, clean the topmost of its
+        # ancestors that is empty too
+        if self.num_children:
+            return
+        node = self
+        while node.parent is not None and not node.parent.num_children:
+            node = node.parent
+        node._clear()
+
+    def __len__(self):
+        return self.num_children
+
+    # get_* methods below walk the tree with an explicit stack instead of
+    # recursing, quadrants are pushed in reverse so that children come out in
+    # depth-first order: node's own children first, then its quadrants' ones;
+    # quadrants with empty sub-trees are not visited at all
 
     def get_children(self):
-        subchildren = [ch for q in self.quadrants for ch in q.get_children()]
-        return self.direct_children + subchildren
+        found = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            found.extend(node.direct_children)
+            stack.extend([q for q in node.quadrants[::-1] if q.num_children])
+        return found
 
     def get_enclosed_children(self, within_bounds):
-        # assure that bounds have proper values
-        within_bounds = fix_bounds(within_bounds)
+        return self._query(fix_bounds(within_bounds), True)
 
-        # no overlap
-        if not overlaps(within_bounds, self.bounds):
-            return []
+    def get_overlapped_children(self, bounds):
+        return self._query(fix_bounds(bounds), False)
 
-        # entire node is enclosed, return everything
-        if fits(self.bounds, within_bounds):
-            return self.get_children()
+    def _query(self, bounds, enclose):
+        # same as list(self._iter_query(...)) with fits / overlaps inlined,
+        # bounds must be already fixed
+        x_min, y_min, x_max, y_max = bounds
+        found = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            nx_min, ny_min, nx_max, ny_max = node.loose_bounds
+            # no overlap
+            if (nx_min > x_max or nx_max < x_min or
+                    ny_min > y_max or ny_max < y_min):
+                continue
+            # entire node is enclosed, take everything
+            if (nx_min >= x_min and nx_max <= x_max and
+                    ny_min >= y_min and ny_max <= y_max):
+                found.extend(node.get_children())
+                continue
+            # node is partially overlapped, test its children
+            if enclose:
+                for ch in node.direct_children:
+                    cx_min, cy_min, cx_max, cy_max = ch.bounds
+                    if (cx_min >= x_min and cx_max <= x_max and
+                            cy_min >= y_min and cy_max <= y_max):
+                        found.append(ch)
+            else:
+                for ch in node.direct_children:
+                    cx_min, cy_min, cx_max, cy_max = ch.bounds
+                    if (cx_min <= x_max and cx_max >= x_min and
+                            cy_min <= y_max and cy_max >= y_min):
+                        found.append(ch)
+            stack.extend([q for q in node.quadrants[::-1] if q.num_children])
+        return found
 
-        # node is partially overlapped, try to get subchildren
-        enclosed_subchildren = [ch for q in self.quadrants for ch
-                                in q.get_enclosed_children(within_bounds)]
-        # find enclosed children
-        enclosed_children = [ch for ch in self.direct_children
-                             if fits(ch.bounds, within_bounds)]
+    def query_many(self, bounds_list, mode='overlap'):
+        """Runs get_overlapped_children (mode 'overlap') or
+        get_enclosed_children (mode 'enclose') for each of bounds_list,
+        visiting every node once for the whole batch.
 
-        return enclosed_children + enclosed_subchildren
+        Returns (offsets, children) lists, results for i-th bounds are
+        children[offsets[i]:offsets[i + 1]] in the same order as a single
+        query would return them.
+        """
+        if mode not in ('overlap', 'enclose'):
+            raise ValueError("mode must be 'overlap' or 'enclose'")
+        enclose = mode == 'enclose'
+        queries = [fix_bounds(b) for b in bounds_list]
+        results = [[] for _ in queries]
+        stack = [(self, range(len(queries)))]
+        while stack:
+            node, indices = stack.pop()
+            nx_min, ny_min, nx_max, ny_max = node.loose_bounds
+            partial = []
+            subtree = None
+            for i in indices:
+                x_min, y_min, x_max, y_max = queries[i]
+                # no overlap
+                if (nx_min > x_max or nx_max < x_min or
+                        ny_min > y_max or ny_max < y_min):
+                    continue
+                # entire node is enclosed, take everything
+                if (nx_min >= x_min and nx_max <= x_max and
+                        ny_min >= y_min and ny_max <= y_max):
+                    if subtree is None:
+                        subtree = node.get_children()
+                    results[i].extend(subtree)
+                    continue
+                partial.append(i)
+            if not partial:
+                continue
+            # node is partially overlapped, test its children
+            for ch in node.direct_children:
+                cx_min, cy_min, cx_max, cy_max = ch.bounds
+                for i in partial:
+                    x_min, y_min, x_max, y_max = queries[i]
+                    if enclose:
+                        if (cx_min >= x_min and cx_max <= x_max and
+                                cy_min >= y_min and cy_max <= y_max):
+                            results[i].append(ch)
+                    elif (cx_min <= x_max and cx_max >= x_min and
+                            cy_min <= y_max and cy_max >= y_min):
+                        results[i].append(ch)
+            stack.extend([(q, partial) for q in node.quadrants[::-1]
+                          if q.num_children])
 
-    def get_overlapped_children(self, bounds):
-        # assure that bounds have proper values
-        bounds = fix_bounds(bounds)
+        offsets = [0]
+        children = []
+        for found in results:
+            children.extend(found)
+            offsets.append(len(children))
+        return offsets, children
+
+    def count_enclosed(self, within_bounds):
+        """Returns len(self.get_enclosed_children(within_bounds))."""
+        return self._count_query(fix_bounds(within_bounds), fits)
+
+    def count_overlapped(self, bounds):
+        """Returns len(self.get_overlapped_children(bounds))."""
+        return self._count_query(fix_bounds(bounds), overlaps)
+
+    def _count_query(self, bounds, test):
+        # same traversal as in _iter_query, but entirely enclosed nodes
+        # contribute their cached count instead of their children
+        count = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not overlaps(bounds, node.loose_bounds):
+                continue
+            if fits(node.loose_bounds, bounds):
+                count += node.num_children
+                continue
+            for ch in node.direct_children:
+                if test(ch.bounds, bounds):
+                    count += 1
+            stack.extend(node.quadrants)
+        return count
+
+    # iterators below yield the same children in the same order as their get_*
+    # counterparts, but one by one without building intermediate lists, so
+    # they can stop early (at `limit` children, or when caller stops
+    # iterating); tree must not be modified while iterating
+
+    def iter_children(self, limit=None):
+        return islice(self._iter_children(), limit)
+
+    def iter_enclosed(self, within_bounds, limit=None):
+        return islice(self._iter_query(fix_bounds(within_bounds), fits),
+                      limit)
 
-        # no overlap
-        if not overlaps(bounds, self.bounds):
+    def iter_overlapped(self, bounds, limit=None):
+        return islice(self._iter_query(fix_bounds(bounds), overlaps), limit)
+
+    def _iter_children(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for ch in node.direct_children:
+                yield ch
+            stack.extend(reversed(node.quadrants))
+
+    def _iter_query(self, bounds, test):
+        # test is either fits or overlaps, called with (child.bounds, bounds)
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not overlaps(bounds, node.loose_bounds):
+                continue
+            if fits(node.loose_bounds, bounds):
+                for ch in node._iter_children():
+                    yield ch
+                continue
+            for ch in node.direct_children:
+                if test(ch.bounds, bounds):
+                    yield ch
+            stack.extend(reversed(node.quadrants))
+
+    def get_children_under_point(self, x, y):
+        """Returns children whose bounds contain point (x, y), borders
+        included; same as get_overlapped_children((x, y, x, y))."""
+        x_min, y_min, x_max, y_max = self.loose_bounds
+        if not (x_min <= x <= x_max and y_min <= y <= y_max):
             return []
+        found = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            for ch in node.direct_children:
+                x_min, y_min, x_max, y_max = ch.bounds
+                if x_min <= x <= x_max and y_min <= y <= y_max:
+                    found.append(ch)
+            if not node.quadrants:
+                continue
+            if node.looseness == 1:
+                # descend into single quadrant, unless point lies on a border
+                tl, tr, bl, br = node.quadrants
+                _, _, x_center, y_center = tl.bounds
+                if y > y_center:
+                    if x > x_center:
+                        stack.append(br)
+                    elif x < x_center:
+                        stack.append(bl)
+                    else:
+                        stack += (br, bl)
+                else:
+                    if y == y_center:
+                        if x >= x_center:
+                            stack.append(br)
+                        if x <= x_center:
+                            stack.append(bl)
+                    if x >= x_center:
+                        stack.append(tr)
+                    if x <= x_center:
+                        stack.append(tl)
+            else:
+                for q in reversed(node.quadrants):
+                    x_min, y_min, x_max, y_max = q.loose_bounds
+                    if x_min <= x <= x_max and y_min <= y <= y_max:
+                        stack.append(q)
+        return found
+
+    def get_children_under_points(self, points):
+        """Returns list of get_children_under_point results, one for each of
+        (x, y) points, visiting every node once for the whole batch."""
+        results = [[] for _ in points]
+        x_min, y_min, x_max, y_max = self.loose_bounds
+        inside = [i for i, (x, y) in enumerate(points)
+                  if x_min <= x <= x_max and y_min <= y <= y_max]
+        stack = [(self, inside)] if inside else []
+        while stack:
+            node, indices = stack.pop()
+            for ch in node.direct_children:
+                x_min, y_min, x_max, y_max = ch.bounds
+                for i in indices:
+                    x, y = points[i]
+                    if x_min <= x <= x_max and y_min <= y <= y_max:
+                        results[i].append(ch)
+            if not node.quadrants:
+                continue
+            # split points among quadrants containing them, a point can only
+            # be in more than one if it lies on a border
+            split = [[], [], [], []]
+            if node.looseness == 1:
+                # top left quadrant ends at node's center
+                _, _, x_center, y_center = node.quadrants[0].bounds
+                for i in indices:
+                    x, y = points[i]
+                    if y <= y_center:
+                        if x <= x_center:
+                            split[0].append(i)
+                        if x >= x_center:
+                            split[1].append(i)
+                    if y >= y_center:
+                        if x <= x_center:
+                            split[2].append(i)
+                        if x >= x_center:
+                            split[3].append(i)
+            else:
+                for q, q_indices in zip(node.quadrants, split):
+                    x_min, y_min, x_max, y_max = q.loose_bounds
+                    q_indices.extend(
+                        i for i in indices
+                        if x_min <= points[i][0] <= x_max and
+                        y_min <= points[i][1] <= y_max)
+            # reversed, so quadrants are popped in order
+            stack.extend((q, q_indices) for q, q_indices
+                         in reversed(list(zip(node.quadrants, split)))
+                         if q_indices)
+        return results
+
+    def nearest(self, x, y, k=1):
+        """Returns up to k children closest to point (x, y), closest first.
+
+        Distance to a child is the distance to the closest point of its
+        bounds. Nodes and children are visited in order of their distance,
+        so only nodes closer than the k-th found child are looked into.
+        """
+        found = []
+        if k < 1:
+            return found
+        tie = count()  # never compare nodes or children in the heap
+        heap = [(0, next(tie), self, True)]
+        while heap:
+            dist, _, obj, is_node = heappop(heap)
+            if not is_node:
+                found.append(obj)
+                if len(found) == k:
+                    break
+                continue
+            for ch in obj.direct_children:
+                heappush(heap, (distance(x, y, ch.bounds), next(tie), ch,
+                                False))
+            for q in obj.quadrants:
+                if q.num_children:
+                    heappush(heap, (distance(x, y, q.loose_bounds), next(tie),
+                                    q, True))
+        return found
+
+    def within_radius(self, x, y, radius):
+        """Returns children whose bounds are at most radius away from point
+        (x, y), in the same order as other queries."""
+        found = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.parent is None:
+                # root's children may not fit it, so they are always tested
+                found.extend(ch for ch in node.direct_children
+                             if distance(x, y, ch.bounds) <= radius)
+                stack.extend(reversed(node.quadrants))
+                continue
+            if distance(x, y, node.loose_bounds) > radius:
+                continue
+            x_min, y_min, x_max, y_max = node.loose_bounds
+            # farthest corner is within radius, return everything
+            dx = max(x - x_min, x_max - x)
+            dy = max(y - y_min, y_max - y)
+            if dx * dx + dy * dy <= radius * radius:
+                found.extend(node._iter_children())
+                continue
+            found.extend(ch for ch in node.direct_children
+                         if distance(x, y, ch.bounds) <= radius)
+            stack.extend(reversed(node.quadrants))
+        return found
+
+    def overlapping_pairs(self):
+        """Yields every pair of children whose bounds overlap, only once.
 
-        # entire node is enclosed, return everything
-        if fits(self.bounds, bounds):
-            return self.get_children()
+        Every child is compared only with children after it in the same node,
+        with children of ancestor nodes that overlap its node and with
+        children of overlapping sibling sub-trees (plain quadrants share
+        their border lines, loose ones overlap more).
+        """
+        stack = [(self, [])]
+        while stack:
+            node, above = stack.pop()
+            children = node.direct_children
+            for i, ch in enumerate(children):
+                bounds = ch.bounds
+                for other in above:
+                    if overlaps(other.bounds, bounds):
+                        yield other, ch
+                for j in range(i + 1, len(children)):
+                    if overlaps(bounds, children[j].bounds):
+                        yield ch, children[j]
+            if not node.quadrants:
+                continue
+            # children of sibling sub-trees overlap only where the siblings'
+            # bounds do: along shared border lines, or more in loose trees
+            quadrants = node.quadrants
+            for i, q in enumerate(quadrants):
+                for other_q in quadrants[i + 1:]:
+                    if (q.num_children and other_q.num_children and
+                            overlaps(q.loose_bounds, other_q.loose_bounds)):
+                        ax_min, ay_min, ax_max, ay_max = q.loose_bounds
+                        bx_min, by_min, bx_max, by_max = other_q.loose_bounds
+                        region = (max(ax_min, bx_min), max(ay_min, by_min),
+                                  min(ax_max, bx_max), min(ay_max, by_max))
+                        for pair in _join(q, other_q, region):
+                            yield pair
+            above = above + children
+            for q in reversed(node.quadrants):
+                if q.num_children:
+                    stack.append((q, [ch for ch in above
+                                      if overlaps(ch.bounds, q.loose_bounds)]))
 
-        # node is partially overlapped, try to get subchildren
-        overlapped_subchildren = [ch for q in self.quadrants
-                                  for ch in q.get_overlapped_children(bounds)]
-        # find overlapped children
-        overlapped_children = [ch for ch in self.direct_children
-                               if overlaps(ch.bounds, bounds)]
+    def join(self, other):
+        """Yields every pair (child, other_child) of overlapping children,
+        where child is from this tree and other_child from the other tree.
 
-        return overlapped_children + overlapped_subchildren
+        Both trees are descended together, only pairs of nodes with
+        overlapping bounds are looked into. To find overlapping children in
+        a single tree use overlapping_pairs.
+        """
+        return _join(self, other)
 
-    def get_children_under_point(self, x, y):  # TODO: inconsistent api
-        return self.get_overlapped_children((x, y, x, y))  # hack
+    def viewport(self, bounds):
+        """Returns Viewport tracking children overlapping bounds."""
+        return Viewport(self, bounds)
 
     def _get_depth(self):
         # for testing and debug
-        if not self.quadrants:
-            return 0
-        return 1 + max(q._get_depth() for q in self.quadrants)
+        depth = 0
+        stack = [(self, 0)]
+        while stack:
+            node, level = stack.pop()
+            depth = max(depth, level)
+            stack.extend((q, level + 1) for q in node.quadrants)
+        return depth
 
     def _get_number_of_nodes(self):
         # for testing and debug
-        if not self.quadrants:
-            return 1
-        return 1 + sum(q._get_number_of_nodes() for q in self.quadrants)
+        count = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            count += 1
+            stack.extend(node.quadrants)
+        return count
 
     def _get_grid_bounds(self):
-        if not self.quadrants:
-            return [self.bounds]
-        return [b for q in self.quadrants for b in q._get_grid_bounds()]
+        found = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node.quadrants:
+                found.append(node.bounds)
+            stack.extend(node.quadrants[::-1])
+        return found
 
     def __repr__(self):
         params = [str(p) for p in list(self.bounds) + [self.max_depth,
@@ -0,0 +1,213 @@
+"""
+Sharing a tree between threads.
+
+`Node` itself does no locking: a query running while another thread removes
+or moves children can return wrong results or fail. `ThreadSafeTree` wraps a
+tree and offers two ways of reading it:
+
+* locked queries (`get_overlapped_children` etc. of the wrapper) take a read
+  lock, any number of them run at once, while changes (`insert`, `move`,
+  `remove`, ...) take a write lock and wait until running queries finish;
+  waiting writers go first, so a steady stream of queries can't starve them.
+  A locked query sees every change completed before it started and none
+  that started after it.
+
+* snapshot queries (`tree.snapshot.get_overlapped_children` etc.) never
+  block: `publish()` makes an immutable copy of the tree's layout and
+  children's bounds, which is then only read. A snapshot query sees the tree
+  exactly as it was when the snapshot was published, later changes are not
+  seen until the next `publish()`; results are the same children in the same
+  order as locked queries made at that moment would give.
+
+Children must be changed only through the wrapper, i.e. bounds are set by
+`move` / `move_many` instead of assigning them and calling `reinsert`, which
+would let locked queries see new bounds in the old place. Returned children
+are shared, not copied.
+"""
+import threading
+from contextlib import contextmanager
+
+from index import Index
+
+
+class RWLock(object):
+    """Readers-writer lock preferring writers, it is not reentrant."""
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class Snapshot(object):
+    """Immutable copy of a tree taken by ThreadSafeTree.publish."""
+    def __init__(self, node):
+        self.children = tuple(node.get_children())
+        self._index = Index(*(node.bounds + (node.max_depth,)),
+                            looseness=node.looseness)
+        self._index.insert_many((i, ch.bounds)
+                                for i, ch in enumerate(self.children))
+
+    def __len__(self):
+        return len(self.children)
+
+    def _children(self, positions):
+        # queries give children in get_children order, so do sorted positions
+        children = self.children
+        return [children[i] for i in sorted(positions)]
+
+    def get_children(self):
+        return list(self.children)
+
+    def get_enclosed_children(self, within_bounds):
+        return self._children(self._index.get_enclosed_children(within_bounds))
+
+    def get_overlapped_children(self, bounds):
+        return self._children(self._index.get_overlapped_children(bounds))
+
+    def get_children_under_point(self, x, y):
+        return self._children(self._index.get_children_under_point(x, y))
+
+    def count_enclosed(self, within_bounds):
+        return self._index.count_enclosed(within_bounds)
+
+    def count_overlapped(self, bounds):
+        return self._index.count_overlapped(bounds)
+
+    def query_many(self, bounds_list, mode='overlap'):
+        offsets, positions = self._index.query_many(bounds_list, mode)
+        children = []
+        for start, end in zip(offsets, offsets[1:]):
+            children.extend(self._children(positions[start:end]))
+        return offsets, children
+
+
+class ThreadSafeTree(object):
+    def __init__(self, node):
+        self.node = node
+        self.lock = RWLock()
+        self.snapshot = Snapshot(node)
+
+    def publish(self):
+        """Makes snapshot of the current tree available as `snapshot`."""
+        with self.lock.reading():
+            snapshot = Snapshot(self.node)
+        # replacing the reference is atomic, readers get old or new one
+        self.snapshot = snapshot
+        return snapshot
+
+    # changes
+
+    def insert(self, child):
+        with self.lock.writing():
+            self.node.insert(child)
+
+    def insert_many(self, children):
+        children = list(children)
+        with self.lock.writing():
+            self.node.insert_many(children)
+
+    def move(self, child, bounds):
+        with self.lock.writing():
+            child.bounds = bounds
+            self.node.reinsert(child)
+
+    def move_many(self, moves):
+        moves = list(moves)
+        with self.lock.writing():
+            self.node.move_many(moves)
+
+    def remove(self, child):
+        with self.lock.writing():
+            self.node.remove(child)
+
+    def clear(self):
+        with self.lock.writing():
+            self.node.clear()
+
+    # locked queries
+
+    def __len__(self):
+        return len(self.node)
+
+    def get_children(self):
+        with self.lock.reading():
+            return self.node.get_children()
+
+    def get_enclosed_children(self, within_bounds):
+        with self.lock.reading():
+            return self.node.get_enclosed_children(within_bounds)
+
+    def get_overlapped_children(self, bounds):
+        with self.lock.reading():
+            return self.node.get_overlapped_children(bounds)
+
+    def get_children_under_point(self, x, y):
+        with self.lock.reading():
+            return self.node.get_children_under_point(x, y)
+
+    def count_enclosed(self, within_bounds):
+        with self.lock.reading():
+            return self.node.count_enclosed(within_bounds)
+
+    def count_overlapped(self, bounds):
+        with self.lock.reading():
+            return self.node.count_overlapped(bounds)
+
+    def query_many(self, bounds_list, mode='overlap'):
+        with self.lock.reading():
+            return self.node.query_many(bounds_list, mode)
+
+    def nearest(self, x, y, k=1):
+        with self.lock.reading():
+            return self.node.nearest(x, y, k)
+
+    def within_radius(self, x, y, radius):
+        with self.lock.reading():
+            return self.node.within_radius(x, y, radius)
+
+    def overlapping_pairs(self):
+        """Returns list of pairs, see Node.overlapping_pairs."""
+        with self.lock.reading():
+            return list(self.node.overlapping_pairs())
@@ -13,5 +13,6 @@ setup(
     url = "https://github.com/bgr/quadpy",
     packages = find_packages(),
     install_requires = [],
+    extras_require = {'numpy': ['numpy']},
 
 )
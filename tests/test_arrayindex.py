@@ -0,0 +1,224 @@
+import pytest
+np = pytest.importorskip('numpy')
+import os
+from multiprocessing import Pool
+from random import uniform
+from quadpy import Node
+from quadpy.arrayindex import ArrayIndex, _shared_path, unlink
+from quadpy.rectangle import Rectangle, random_bounds
+
+
+def build_both(tree_bounds, item_bounds, max_depth):
+    qt = Node(*(tree_bounds + (max_depth,)))
+    rects = [Rectangle(*b) for b in item_bounds]
+    [qt.insert(r) for r in rects]
+    index = ArrayIndex(*(tree_bounds + (max_depth,)))
+    index.build(item_bounds)
+    ids = dict((id(r), i) for i, r in enumerate(rects))
+    return qt, index, ids
+
+
+def node_ids(children, ids):
+    return sorted(ids[id(ch)] for ch in children)
+
+
+class Test_array_index_matches_node:
+    @pytest.mark.parametrize('tree_bounds', [
+        (0, 0, 1000, 1000),
+        (-1000, -300, -200, -100),
+        (0, 0, 1, 1),
+    ])
+    @pytest.mark.parametrize('max_depth', [0, 1, 4, 9])
+    def test_random_queries(self, tree_bounds, max_depth):
+        w = tree_bounds[2] - tree_bounds[0]
+        h = tree_bounds[3] - tree_bounds[1]
+        outer = (tree_bounds[0] - w / 4.0, tree_bounds[1] - h / 4.0,
+                 tree_bounds[2] + w / 4.0, tree_bounds[3] + h / 4.0)
+        item_bounds = ([random_bounds(tree_bounds, w / 20.0)
+                        for _ in range(300)] +
+                       [random_bounds(outer) for _ in range(50)])
+        qt, index, ids = build_both(tree_bounds, item_bounds, max_depth)
+        assert len(index) == 350
+        assert sorted(index.get_children()) == list(range(350))
+        for _ in range(100):
+            query = random_bounds(outer)
+            assert (sorted(index.get_overlapped_children(query)) ==
+                    node_ids(qt.get_overlapped_children(query), ids))
+            assert (sorted(index.get_enclosed_children(query)) ==
+                    node_ids(qt.get_enclosed_children(query), ids))
+            x, y = uniform(outer[0], outer[2]), uniform(outer[1], outer[3])
+            assert (sorted(index.get_children_under_point(x, y)) ==
+                    node_ids(qt.get_children_under_point(x, y), ids))
+
+    @pytest.mark.parametrize('mode', ['overlap', 'enclose'])
+    def test_query_many(self, mode):
+        item_bounds = [random_bounds((0, 0, 1000, 1000), 50)
+                       for _ in range(500)]
+        qt, index, ids = build_both((0, 0, 1000, 1000), item_bounds, 7)
+        queries = ([random_bounds((-100, -100, 1100, 1100), 200)
+                    for _ in range(100)] + [(500, 500, 500, 500)])
+        offsets, found = index.query_many(queries, mode)
+        offsets_qt, found_qt = qt.query_many(queries, mode)
+        assert len(offsets) == len(queries) + 1
+        for i in range(len(queries)):
+            assert (sorted(found[offsets[i]:offsets[i + 1]]) ==
+                    node_ids(found_qt[offsets_qt[i]:offsets_qt[i + 1]], ids))
+
+    def test_tiled_same_cells(self):
+        # tiles lie exactly on the center lines of many nodes
+        item_bounds = [(x, y, x + 10, y + 10)
+                       for x in range(0, 1000, 10)
+                       for y in range(0, 1000, 10)]
+        qt, index, ids = build_both((0, 0, 1000, 1000), item_bounds, 6)
+        assert index._get_number_of_nodes() <= qt._get_number_of_nodes()
+        for query in [(377, 499, 401, 601), (387, 501, 391, 591),
+                      (-1, -1, 1001, 1001), (10, 10, 10, 10)]:
+            assert (sorted(index.get_overlapped_children(query)) ==
+                    node_ids(qt.get_overlapped_children(query), ids))
+            assert (sorted(index.get_enclosed_children(query)) ==
+                    node_ids(qt.get_enclosed_children(query), ids))
+
+
+class Test_array_index:
+    def test_empty(self):
+        index = ArrayIndex(0, 0, 100, 100)
+        assert len(index) == 0
+        assert list(index.get_overlapped_children((0, 0, 100, 100))) == []
+        assert index._get_number_of_nodes() == 1
+
+    def test_custom_ids_and_inverted_bounds(self):
+        index = ArrayIndex(0, 0, 100, 100)
+        index.build([(20, 20, 10, 10), (60, 60, 70, 70)], ids=[7, 42])
+        assert list(index.get_enclosed_children((0, 0, 50, 50))) == [7]
+        assert list(index.get_overlapped_children((100, 0, 65, 65))) == [42]
+        assert index.get_children().dtype == np.int64
+
+    def test_query_many_empty(self):
+        index = ArrayIndex(0, 0, 100, 100)
+        offsets, ids = index.query_many(np.empty((0, 4)))
+        assert list(offsets) == [0] and len(ids) == 0
+        index.build([(1, 1, 2, 2)])
+        offsets, ids = index.query_many([(50, 50, 60, 60), (0, 0, 5, 5)],
+                                        'enclose')
+        assert list(offsets) == [0, 0, 1] and list(ids) == [0]
+        with pytest.raises(ValueError):
+            index.query_many([(0, 0, 1, 1)], 'within')
+
+    def test_ids_length_mismatch(self):
+        index = ArrayIndex(0, 0, 100, 100)
+        with pytest.raises(ValueError):
+            index.build([(0, 0, 1, 1)], ids=[1, 2])
+
+    def test_too_deep(self):
+        with pytest.raises(ValueError):
+            ArrayIndex(0, 0, 100, 100, 29)
+
+
+def query_attached(args):
+    name, query = args
+    return sorted(ArrayIndex.attach(name).get_overlapped_children(query))
+
+
+class Test_frozen_snapshots:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 4}])
+    def test_from_node(self, options):
+        qt = Node(0, 0, 1000, 1000, 7, **options)
+        rects = [Rectangle(*random_bounds((-50, -50, 1050, 1050), 40))
+                 for _ in range(400)]
+        [qt.insert(r) for r in rects]
+        index = ArrayIndex.from_node(qt)
+        ids = dict((id(ch), i) for i, ch in enumerate(qt.get_children()))
+        for _ in range(50):
+            query = random_bounds((-100, -100, 1100, 1100))
+            assert (sorted(index.get_overlapped_children(query)) ==
+                    node_ids(qt.get_overlapped_children(query), ids))
+            assert (sorted(index.get_enclosed_children(query)) ==
+                    node_ids(qt.get_enclosed_children(query), ids))
+
+    def test_share_and_attach(self):
+        index = ArrayIndex(0, 0, 1000, 1000, 6)
+        item_bounds = [random_bounds((0, 0, 1000, 1000), 30)
+                       for _ in range(300)]
+        index.build(item_bounds, ids=range(1000, 1300))
+        name = 'quadpy-test-{0}'.format(os.getpid())
+        index.share(name)
+        try:
+            with pytest.raises(OSError):
+                index.share(name)
+            attached = ArrayIndex.attach(name)
+            assert len(attached) == 300
+            assert attached.bounds == index.bounds
+            assert attached.max_depth == 6
+            queries = [random_bounds((0, 0, 1000, 1000)) for _ in range(20)]
+            for query in queries:
+                assert (list(attached.get_enclosed_children(query)) ==
+                        list(index.get_enclosed_children(query)))
+            assert list(attached.get_children_under_point(500, 500)) == \
+                list(index.get_children_under_point(500, 500))
+            with pytest.raises(ValueError):
+                attached._item_ids[0] = 1
+            pool = Pool(2)
+            try:
+                results = pool.map(query_attached,
+                                   [(name, q) for q in queries])
+            finally:
+                pool.close()
+                pool.join()
+            assert results == [sorted(index.get_overlapped_children(q))
+                               for q in queries]
+        finally:
+            unlink(name)
+        assert not os.path.exists(_shared_path(name))
+        # attached index outlives the removed block
+        assert len(attached.get_overlapped_children((0, 0, 1000, 1000))) == 300
+
+    @pytest.mark.parametrize('mmap', [True, False])
+    def test_save_and_load(self, tmpdir, mmap):
+        qt = Node(0, 0, 1000, 1000, 8)
+        rects = [Rectangle(*random_bounds((-50, -50, 1050, 1050), 40))
+                 for _ in range(500)]
+        qt.insert_many(rects)
+        path = str(tmpdir.join('index.qpy'))
+        ArrayIndex.from_node(qt).save(path)
+        loaded = ArrayIndex.load(path, mmap=mmap)
+        assert len(loaded) == 500
+        children = qt.get_children()
+        queries = [random_bounds((-100, -100, 1100, 1100)) for _ in range(50)]
+        for query in queries:
+            assert ([children[i] for i in
+                     sorted(loaded.get_overlapped_children(query))] ==
+                    qt.get_overlapped_children(query))
+            assert ([children[i] for i in
+                     sorted(loaded.get_enclosed_children(query))] ==
+                    qt.get_enclosed_children(query))
+        # saving again replaces the file
+        ArrayIndex(0, 0, 1, 1).save(path)
+        assert len(ArrayIndex.load(path, mmap=mmap)) == 0
+
+    def test_load_bad_files(self, tmpdir):
+        path = str(tmpdir.join('index.qpy'))
+        index = ArrayIndex(0, 0, 100, 100)
+        index.build([(1, 1, 2, 2), (50, 50, 60, 60)])
+        index.save(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for bad in [b'', data[:10], data[:-8],
+                    data[:8] + b'\x02' + data[9:], b'x' * len(data)]:
+            with open(path, 'wb') as f:
+                f.write(bad)
+            for mmap in [True, False]:
+                with pytest.raises(ValueError):
+                    ArrayIndex.load(path, mmap=mmap)
+
+    def test_bad_names_and_blocks(self):
+        with pytest.raises(ValueError):
+            ArrayIndex.attach('../etc')
+        name = 'quadpy-test-bad-{0}'.format(os.getpid())
+        with open(_shared_path(name), 'wb') as f:
+            f.write(b'x' * 100)
+        try:
+            with pytest.raises(ValueError):
+                ArrayIndex.attach(name)
+        finally:
+            unlink(name)
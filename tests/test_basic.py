@@ -1,7 +1,8 @@
+import pickle
 import pytest
-from quadpy import Node
+from quadpy import Node, NodePool
 from quadpy.quadtree import fits, overlaps
-from quadpy.rectangle import Rectangle, random_rectangle
+from quadpy.rectangle import Rectangle, random_bounds, random_rectangle
 
 
 
@@ -200,3 +201,592 @@ class Test_reinsert:
         # make sure that bottom-right quadrant is the only one subdivided
         depths = [qt.quadrants[i]._get_depth() for i in range(4)]
         assert depths == [0, 0, 0, max_depth - 1]
+
+    def test_reinsert_point_outside_tree(self):
+        qt = Node(0, 0, 10, 10, 4)
+        point = Rectangle(5, 5, 5, 5)
+        qt.insert(point)
+        point.bounds = (20, 20, 20, 20)
+        qt.reinsert(point)
+        assert point.qt_data == (qt, 0)
+        assert qt.get_overlapped_children((9, 9, 11, 11)) == []
+        assert qt.count_overlapped((9, 9, 11, 11)) == 0
+        other = Rectangle(9.5, 9.5, 9.5, 9.5)
+        qt.insert(other)
+        assert qt.nearest(11, 11, 2) == [other, point]
+        outside = Rectangle(-3, 4, -3, 4)
+        qt.insert(outside)
+        assert qt.direct_children == [point, outside]
+
+
+def dump(node):
+    """Returns nested structure of node, identifying children by identity."""
+    return (node.bounds, node.max_depth,
+            [id(ch) for ch in node.direct_children],
+            [dump(q) for q in node.quadrants])
+
+
+class Test_insert_many:
+    @pytest.mark.parametrize('options', [{}, {'grow': True}])
+    @pytest.mark.parametrize('max_depth', [0, 1, 3, 6, 12])
+    def test_same_tree_as_repeated_insert(self, max_depth, options):
+        bounds = (0, 0, 1024, 1024)
+        outer = (-100, -100, 1124, 1124)
+        rects = ([random_rectangle(bounds, 40) for _ in range(300)] +
+                 [random_rectangle(outer) for _ in range(30)] +
+                 [Rectangle(x, y, x + 64, y + 64)  # on center lines
+                  for x in range(0, 1024, 64) for y in range(0, 1024, 64)] +
+                 [Rectangle(512, 512, 512, 512), Rectangle(0, 0, 0, 0)])
+        qt1 = Node(*(bounds + (max_depth,)), **options)
+        [qt1.insert(r) for r in rects]
+        qt2 = Node(*(bounds + (max_depth,)), **options)
+        qt2.insert_many(rects)
+        assert dump(qt1) == dump(qt2)
+        for r in rects:
+            node, index = r.qt_data
+            assert node.direct_children[index] is r
+
+    def test_grows_like_repeated_insert(self):
+        rects = [Rectangle(15, 5, 16, 6), Rectangle(-5, 5, -4, 6)]
+        qt1 = Node(0, 0, 10, 10, 2, grow=True)
+        [qt1.insert(r) for r in rects]
+        qt2 = Node(0, 0, 10, 10, 2, grow=True)
+        qt2.insert_many(rects)
+        assert qt2.bounds == qt1.bounds == (-20, 0, 20, 40)
+        assert dump(qt1) == dump(qt2)
+
+    def test_into_populated_tree(self):
+        rects = [random_rectangle((0, 0, 100, 100), 10) for _ in range(200)]
+        qt1 = Node(0, 0, 100, 100, 5)
+        [qt1.insert(r) for r in rects]
+        qt2 = Node(0, 0, 100, 100, 5)
+        [qt2.insert(r) for r in rects[:50]]
+        qt2.insert_many(rects[50:])
+        assert dump(qt1) == dump(qt2)
+        [qt2.remove(r) for r in rects]
+        assert qt2._get_number_of_nodes() == 1
+
+    def test_from_bounds(self):
+        item_bounds = [(10, 10, 20, 20), (80, 90, 70, 60), (-5, 0, 0, 5)]
+        qt = Node.from_bounds(item_bounds, max_depth=3)
+        assert qt.bounds == (-5, 0, 80, 90)
+        assert sorted(ch.bounds for ch in qt.get_children()) == sorted(
+            [(10, 10, 20, 20), (70, 60, 80, 90), (-5, 0, 0, 5)])
+        qt = Node.from_bounds(item_bounds, bounds=(0, 0, 100, 100))
+        assert qt.bounds == (0, 0, 100, 100)
+        assert len(qt.get_overlapped_children((0, 0, 100, 100))) == 3
+
+    def test_from_bounds_empty(self):
+        with pytest.raises(ValueError):
+            Node.from_bounds([])
+        assert Node.from_bounds([], bounds=(0, 0, 1, 1)).get_children() == []
+
+
+class Test_counts:
+    def check_counts(self, node):
+        assert len(node) == len(node.get_children())
+        [self.check_counts(q) for q in node.quadrants]
+
+    def test_counts_follow_insert_remove_reinsert(self):
+        qt = Node(0, 0, 1000, 1000, 6)
+        rects = [random_rectangle((-100, -100, 1100, 1100), 100)
+                 for _ in range(300)]
+        assert len(qt) == 0
+        [qt.insert(r) for r in rects[:100]]
+        qt.insert_many(rects[100:])
+        assert len(qt) == 300
+        self.check_counts(qt)
+        for r in rects[:100]:
+            r.bounds = random_rectangle((0, 0, 1000, 1000), 50).bounds
+            qt.reinsert(r)
+        self.check_counts(qt)
+        [qt.remove(r) for r in rects[::2]]
+        assert len(qt) == 150
+        self.check_counts(qt)
+        qt.quadrants[0].clear()
+        self.check_counts(qt)
+        qt.clear()
+        assert len(qt) == 0
+
+    def test_empty_parent_does_not_stop_cleanup(self):
+        qt = Node(0, 0, 1024, 1024, 8)
+        rect = Rectangle(0.001, 0.001, 0.002, 0.002)
+        qt.insert(rect)
+        qt.reinsert(rect)
+        qt.remove(rect)
+        assert qt._get_number_of_nodes() == 1
+
+    def test_count_queries(self):
+        qt = Node(0, 0, 1000, 1000, 5)
+        [qt.insert(random_rectangle((-50, -50, 1050, 1050), 100))
+         for _ in range(1000)]
+        for _ in range(50):
+            bounds = random_rectangle((-100, -100, 1100, 1100)).bounds
+            assert (qt.count_overlapped(bounds) ==
+                    len(qt.get_overlapped_children(bounds)))
+            assert (qt.count_enclosed(bounds) ==
+                    len(qt.get_enclosed_children(bounds)))
+        assert qt.count_overlapped((-100, -100, 1100, 1100)) == 1000
+
+
+class Test_grow:
+    def check_tree(self, node):
+        for i, ch in enumerate(node.direct_children):
+            assert ch.qt_data == (node, i)
+            if node.parent is not None or node.grow:
+                assert fits(ch.bounds, node.bounds)
+        for q in node.quadrants:
+            assert q.parent is node
+            assert q.max_depth == node.max_depth - 1
+            assert fits(q.bounds, node.bounds)
+            self.check_tree(q)
+
+    def test_insert_outside_grows_root(self):
+        qt = Node(0, 0, 100, 100, 3, grow=True)
+        inside = Rectangle(10, 10, 11, 11)
+        qt.insert(inside)
+        quadrant = qt.quadrants[0]
+        outside = Rectangle(-150, 250, -140, 260)
+        qt.insert(outside)
+        assert qt.bounds == (-300, 0, 100, 400)
+        assert qt.max_depth == 5
+        assert qt.direct_children == []
+        assert qt.quadrants[1].bounds == (-100, 0, 100, 200)
+        # old nodes are kept, only moved one level down
+        assert qt.quadrants[1].quadrants[1].quadrants[0] is quadrant
+        assert sorted(qt.get_children(), key=id) == sorted([inside, outside],
+                                                           key=id)
+        assert qt.get_overlapped_children((-1000, 300, 1000, 400)) == []
+        self.check_tree(qt)
+
+    def test_growing_keeps_leaf_size(self):
+        qt = Node(0, 0, 64, 64, 4, grow=True)
+        qt.insert(Rectangle(1000, 1000, 1000.5, 1000.5))
+        leaf = qt
+        while leaf.quadrants:
+            leaf = [q for q in leaf.quadrants if q.quadrants or
+                    q.direct_children][0]
+        assert leaf.bounds[2] - leaf.bounds[0] == 4
+
+    def test_random(self):
+        qt = Node(0, 0, 10, 10, 4, grow=True)
+        rects = [random_rectangle((-1000, -1000, 1000, 1000), 50)
+                 for _ in range(200)]
+        [qt.insert(r) for r in rects[:100]]
+        qt.insert_many(rects[100:])
+        assert len(qt) == 200
+        self.check_tree(qt)
+        for r in rects[:50]:
+            r.bounds = random_rectangle((-3000, -3000, 3000, 3000), 50).bounds
+            qt.reinsert(r)
+        self.check_tree(qt)
+        for r in rects:
+            assert r in qt.get_overlapped_children(r.bounds)
+            qt.remove(r)
+        assert qt._get_number_of_nodes() == 1
+
+    def test_empty_and_zero_size(self):
+        qt = Node(0, 0, 10, 10, 2, grow=True)
+        qt.insert(Rectangle(-5, -5, -4, -4))
+        assert qt.bounds == (-10, -10, 10, 10)
+        assert qt.max_depth == 3
+        with pytest.raises(ValueError):
+            Node(0, 0, 0, 10, grow=True).insert(Rectangle(1, 1, 2, 2))
+
+    def test_not_growing_by_default(self):
+        qt = Node(0, 0, 10, 10, 2)
+        rect = Rectangle(-5, -5, -4, -4)
+        qt.insert(rect)
+        assert qt.bounds == (0, 0, 10, 10)
+        assert qt.direct_children == [rect]
+
+
+class Test_bucket_capacity:
+    def check_tree(self, node, capacity):
+        assert len(node) == len(node.get_children())
+        for i, ch in enumerate(node.direct_children):
+            assert ch.qt_data == (node, i)
+        if not node.quadrants:
+            # leaf can only overflow at max depth
+            assert (len(node.direct_children) <= capacity
+                    or node.max_depth == 0)
+        else:
+            assert len(node) >= capacity // 2
+        for q in node.quadrants:
+            self.check_tree(q, capacity)
+
+    def test_single_child_does_not_subdivide(self):
+        qt = Node(0, 0, 1024, 1024, 9, bucket_capacity=4)
+        rect = Rectangle(0.001, 0.001, 0.002, 0.002)
+        qt.insert(rect)
+        assert qt._get_number_of_nodes() == 1
+        assert qt.direct_children == [rect]
+
+    def test_split_on_overflow(self):
+        qt = Node(0, 0, 1024, 1024, 9, bucket_capacity=4)
+        rects = [Rectangle(i, i, i + 1, i + 1) for i in range(5)]
+        [qt.insert(r) for r in rects[:4]]
+        assert qt._get_number_of_nodes() == 1
+        qt.insert(rects[4])
+        assert qt.direct_children == []
+        assert len(qt.quadrants[0]) == 5
+        self.check_tree(qt, 4)
+
+    def test_random_insert_remove_reinsert(self):
+        capacity = 8
+        qt = Node(0, 0, 1000, 1000, 8, bucket_capacity=capacity)
+        reference = Node(0, 0, 1000, 1000, 8)
+        rects = [random_rectangle((0, 0, 1000, 1000), 20)
+                 for _ in range(1000)]
+        qt.insert_many(rects[:500])
+        [qt.insert(r) for r in rects[500:]]
+        self.check_tree(qt, capacity)
+        assert qt._get_number_of_nodes() < 1000
+        for r in rects[::3]:
+            r.bounds = random_rectangle((0, 0, 1000, 1000), 20).bounds
+            qt.reinsert(r)
+        self.check_tree(qt, capacity)
+        # copies, so qt_data of rects is kept
+        [reference.insert(Rectangle(*r.bounds)) for r in rects]
+        key = lambda r: r.bounds
+        for _ in range(50):
+            bounds = random_rectangle((0, 0, 1000, 1000)).bounds
+            assert (sorted(qt.get_overlapped_children(bounds), key=key) ==
+                    sorted(reference.get_overlapped_children(bounds), key=key))
+        for r in rects[:-3]:
+            qt.remove(r)
+        self.check_tree(qt, capacity)
+        assert qt._get_number_of_nodes() == 1
+        assert len(qt.direct_children) == 3
+
+    @pytest.mark.parametrize('pool', [None, NodePool()])
+    def test_reinsert_after_merge(self, pool):
+        # removing the moved child merges nodes above the one it moves into
+        qt = Node(0, 0, 100, 100, 4, bucket_capacity=8, pool=pool)
+        rects = [Rectangle(1 + i * 0.1, 1, 1.05 + i * 0.1, 1.05)
+                 for i in range(9)]
+        [qt.insert(r) for r in rects]
+        for r in rects[4:]:
+            qt.remove(r)
+        rects[0].bounds = (20, 20, 21, 21)
+        qt.reinsert(rects[0])
+        self.check_tree(qt, 8)
+        assert qt.get_overlapped_children((20, 20, 21, 21)) == [rects[0]]
+        assert sorted(qt.get_children()) == sorted(rects[:4])
+
+    def test_invalid_capacity(self):
+        with pytest.raises(ValueError):
+            Node(0, 0, 10, 10, bucket_capacity=0)
+
+
+def check_qt_data(node):
+    """Checks that every child's qt_data points to where it is."""
+    assert len(node) == len(node.get_children())
+    for i, ch in enumerate(node.direct_children):
+        assert ch.qt_data == (node, i)
+    for q in node.quadrants:
+        assert q.parent is node
+        check_qt_data(q)
+
+
+class Test_local_reinsert:
+    def test_unchanged_node_is_kept(self):
+        qt = Node(0, 0, 1024, 1024, 5)
+        rect = Rectangle(500, 500, 520, 520)  # crosses center lines
+        other = Rectangle(510, 510, 530, 530)
+        qt.insert(rect)
+        qt.insert(other)
+        rect.bounds = (505, 490, 515, 530)
+        qt.reinsert(rect)
+        assert rect.qt_data == (qt, 0)
+        assert qt.direct_children == [rect, other]
+
+    def test_move_into_sibling_and_back(self):
+        qt = Node(0, 0, 1024, 1024, 5)
+        rect = Rectangle(1, 1, 2, 2)
+        qt.insert(rect)
+        rect.bounds = (33, 1, 34, 2)
+        qt.reinsert(rect)
+        assert rect.qt_data[0].bounds == (32, 0, 64, 32)
+        assert qt._get_number_of_nodes() == 1 + 5 * 4
+        rect.bounds = (1000, 1000, 1001, 1001)
+        qt.reinsert(rect)
+        assert rect.qt_data[0].bounds == (992, 992, 1024, 1024)
+        assert qt._get_number_of_nodes() == 1 + 5 * 4
+        check_qt_data(qt)
+
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 6},
+                                         {'grow': True}])
+    def test_random_small_moves(self, options):
+        qt = Node(0, 0, 1000, 1000, 7, **options)
+        rects = [random_rectangle((0, 0, 1000, 1000), 20) for _ in range(300)]
+        [qt.insert(r) for r in rects]
+        for _ in range(10):
+            for r in rects:
+                dx, dy = random_bounds((-15, -15, 15, 15))[:2]
+                x_min, y_min, x_max, y_max = r.bounds
+                r.bounds = (x_min + dx, y_min + dy, x_max + dx, y_max + dy)
+                qt.reinsert(r)
+            check_qt_data(qt)
+        for r in rects:
+            if fits(r.bounds, qt.bounds):  # some might have left the tree
+                assert r in qt.get_overlapped_children(r.bounds)
+            qt.remove(r)
+        assert qt._get_number_of_nodes() == 1
+
+
+class Test_move_many:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 6},
+                                         {'grow': True}])
+    def test_same_as_reinsert(self, options):
+        rects = [random_rectangle((0, 0, 1000, 1000), 20) for _ in range(300)]
+        copies = [Rectangle(*r.bounds) for r in rects]
+        qt = Node(0, 0, 1000, 1000, 7, **options)
+        reference = Node(0, 0, 1000, 1000, 7, **options)
+        [qt.insert(r) for r in rects]
+        [reference.insert(r) for r in copies]
+        for _ in range(5):
+            new_bounds = [random_rectangle((-50, -50, 1050, 1050), 20).bounds
+                          for _ in rects]
+            qt.move_many(zip(rects, new_bounds))
+            for r, b in zip(copies, new_bounds):
+                r.bounds = b
+                reference.reinsert(r)
+            check_qt_data(qt)
+            if not options:
+                key = lambda r: r.bounds
+                assert sorted(qt.get_children(), key=key) == \
+                    sorted(reference.get_children(), key=key)
+                assert qt._get_grid_bounds() == reference._get_grid_bounds()
+
+    def test_swap_keeps_nodes(self):
+        qt = Node(0, 0, 1024, 1024, 5)
+        a, b = Rectangle(1, 1, 2, 2), Rectangle(1000, 1000, 1001, 1001)
+        qt.insert(a)
+        qt.insert(b)
+        node_a, node_b = a.qt_data[0], b.qt_data[0]
+        qt.move_many([(a, b.bounds), (b, a.bounds)])
+        # nodes emptied by first move were filled again by the second one
+        assert a.qt_data[0] is node_b
+        assert b.qt_data[0] is node_a
+        assert qt._get_number_of_nodes() == 1 + 2 * 5 * 4 - 4
+        qt.move_many([(a, (1, 1, 2, 2)), (b, (2, 2, 3, 3))])
+        assert qt._get_number_of_nodes() == 1 + 5 * 4
+        check_qt_data(qt)
+
+
+class Test_node_pool:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 6}])
+    def test_steady_state_reuses_nodes(self, options):
+        pool = NodePool()
+        qt = Node(0, 0, 1000, 1000, 6, pool=pool, **options)
+        rects = [random_rectangle((0, 0, 1000, 1000), 20) for _ in range(200)]
+        for _ in range(2):
+            [qt.insert(r) for r in rects]
+            [qt.remove(r) for r in rects]
+        created = pool.created
+        assert created > 0
+        assert qt._get_number_of_nodes() == 1
+        assert len(pool) == pool.created
+        for _ in range(3):
+            [qt.insert(r) for r in rects]
+            check_qt_data(qt)
+            [qt.remove(r) for r in rects]
+        assert pool.created == created
+        assert pool.reused > 0
+        assert pool.stats()['discarded'] == 0
+
+    def test_same_tree_as_without_pool(self):
+        rects = [random_rectangle((0, 0, 1000, 1000), 20) for _ in range(300)]
+        copies = [Rectangle(*r.bounds) for r in rects]
+        qt = Node(0, 0, 1000, 1000, 6, pool=NodePool())
+        reference = Node(0, 0, 1000, 1000, 6)
+        [qt.insert(r) for r in rects]
+        [reference.insert(r) for r in copies]
+        for _ in range(3):
+            for r, c in zip(rects, copies):
+                r.bounds = c.bounds = random_rectangle((0, 0, 1000, 1000),
+                                                       20).bounds
+                qt.reinsert(r)
+                reference.reinsert(c)
+            check_qt_data(qt)
+            assert qt._get_grid_bounds() == reference._get_grid_bounds()
+
+    def test_max_size(self):
+        pool = NodePool(max_size=5)
+        qt = Node(0, 0, 1024, 1024, 5, pool=pool)
+        r = Rectangle(1, 1, 2, 2)
+        qt.insert(r)
+        qt.remove(r)
+        assert len(pool) == 5
+        assert pool.released == 5
+        assert pool.discarded == 5 * 4 - 5
+        assert all(n.parent is None for n in pool.free)
+        with pytest.raises(ValueError):
+            NodePool(max_size=-1)
+
+    def test_shared_between_trees(self):
+        pool = NodePool()
+        a = Node(0, 0, 100, 100, 3, pool=pool)
+        b = Node(500, 500, 600, 600, 3, pool=pool)
+        r = Rectangle(1, 1, 2, 2)
+        a.insert(r)
+        a.remove(r)
+        r.bounds = (501, 501, 502, 502)
+        b.insert(r)
+        assert pool.created == 12
+        assert pool.reused == 12
+        assert b.get_children_under_point(501.5, 501.5) == [r]
+        assert r.qt_data[0].bounds == (500, 500, 512.5, 512.5)
+
+
+class Test_compact_layout:
+    def test_nodes_have_no_dict(self):
+        qt = Node(0, 0, 100, 100, 2, pool=NodePool())
+        qt.insert(Rectangle(1, 1, 2, 2))
+        for node in [qt] + qt.quadrants:
+            assert not hasattr(node, '__dict__')
+        with pytest.raises(AttributeError):
+            qt.foo = 1
+
+    def test_sides_follow_bounds(self):
+        qt = Node(0, 0, 100, 100, 2, grow=True)
+        assert (qt.x_min, qt.y_min, qt.x_max, qt.y_max) == qt.bounds
+        qt.insert(Rectangle(150, 150, 160, 160))
+        assert (qt.x_min, qt.y_min, qt.x_max, qt.y_max) == (0, 0, 200, 200)
+
+    def test_qt_data_reused_across_moves(self):
+        qt = Node(0, 0, 1000, 1000, 5)
+        rects = [random_rectangle((0, 0, 1000, 1000), 20) for _ in range(50)]
+        [qt.insert(r) for r in rects]
+        records = [r.qt_data for r in rects]
+        for r in rects:
+            r.bounds = random_rectangle((0, 0, 1000, 1000), 20).bounds
+            qt.reinsert(r)
+        qt.move_many((r, random_rectangle((0, 0, 1000, 1000), 20).bounds)
+                     for r in rects)
+        assert all(r.qt_data is rec for r, rec in zip(rects, records))
+        check_qt_data(qt)
+
+    def test_qt_data_behaves_like_tuple(self):
+        qt = Node(0, 0, 100, 100, 0)
+        r = Rectangle(1, 1, 2, 2)
+        qt.insert(r)
+        node, index = r.qt_data
+        assert (node, index) == (qt, 0)
+        assert r.qt_data[0] is qt and r.qt_data[-1] == 0
+        assert len(r.qt_data) == 2
+        assert r.qt_data == (qt, 0) and r.qt_data != (qt, 1)
+        assert r.qt_data != None
+
+
+class Test_deep_trees:
+    def test_copy(self):
+        import copy
+        qt = Node(0, 0, 100, 100, 3)
+        r = Rectangle(1, 1, 2, 2)
+        qt.insert(r)
+        with pytest.raises(TypeError):
+            copy.copy(qt)
+        assert r.qt_data[0].parent.parent.parent is qt
+        qt.remove(r)
+        assert len(qt) == 0 and qt.get_children() == []
+        qt.insert(r)
+        deep = copy.deepcopy(qt)
+        check_qt_data(qt)
+        check_qt_data(deep)
+        assert deep.get_children()[0] is not r
+
+    def test_deeper_than_recursion_limit(self):
+        import sys
+        depth = sys.getrecursionlimit() + 100
+        qt = Node(0, 0, 1, 1, depth)
+        a, b = Rectangle(0, 0, 0, 0), Rectangle(1, 1, 1, 1)
+        qt.insert(a)
+        qt.insert(b)
+        assert qt._get_depth() == depth
+        assert qt._get_number_of_nodes() == 1 + 4 + 2 * 4 * (depth - 1)
+        assert qt.get_children() == [a, b]
+        assert qt.get_overlapped_children((0, 0, 0.5, 0.5)) == [a]
+        assert qt.get_enclosed_children((0.5, 0.5, 1, 1)) == [b]
+        a.bounds = (0.6, 0.6, 0.6, 0.6)
+        qt.reinsert(a)
+        qt.remove(b)
+        assert qt.get_children() == [a]
+        qt.remove(a)
+        assert qt._get_number_of_nodes() == 1
+        qt.insert(a)
+        qt.clear()
+        assert qt._get_depth() == 0 and len(qt) == 0
+
+
+class Test_pickling:
+    @pytest.mark.parametrize('protocol', [0, 2])
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 6},
+                                         {'grow': True},
+                                         {'pool': NodePool()}])
+    def test_round_trip(self, options, protocol):
+        qt = Node(0, 0, 1000, 1000, 6, **options)
+        rects = [random_rectangle((-500, -500, 1500, 1500), 30)
+                 for _ in range(300)]
+        [qt.insert(r) for r in rects]
+        copy = pickle.loads(pickle.dumps(qt, protocol))
+        assert copy.bounds == qt.bounds
+        assert copy.max_depth == qt.max_depth
+        assert copy.looseness == qt.looseness
+        assert copy.bucket_capacity == qt.bucket_capacity
+        assert copy.grow == qt.grow
+        assert copy._get_grid_bounds() == qt._get_grid_bounds()
+        assert copy.get_children() == qt.get_children()
+        assert len(copy) == len(qt)
+        for node in [copy] + copy.quadrants:
+            assert len(node) == len(node.get_children())
+        check_qt_data(copy)
+        check_qt_data(qt)
+        query = (100, 100, 600, 600)
+        assert (copy.get_overlapped_children(query) ==
+                qt.get_overlapped_children(query))
+        # unpickled tree keeps working
+        for r in copy.get_children()[::2]:
+            copy.remove(r)
+        check_qt_data(copy)
+
+    def test_sub_node_and_children(self):
+        qt = Node(0, 0, 100, 100, 3)
+        r = Rectangle(1, 1, 2, 2)
+        qt.insert(r)
+        node, child = pickle.loads(pickle.dumps((r.qt_data[0], r), 2))
+        assert node.bounds == r.qt_data[0].bounds
+        assert child.qt_data == (node, 0)
+        assert node.parent.parent.parent.parent is None
+        # child pickled alone doesn't drag the tree along
+        assert pickle.loads(pickle.dumps(r)).qt_data == (None, 0)
+
+    def test_copy(self):
+        import copy
+        qt = Node(0, 0, 100, 100, 3)
+        r = Rectangle(1, 1, 2, 2)
+        qt.insert(r)
+        with pytest.raises(TypeError):
+            copy.copy(qt)
+        assert r.qt_data[0].parent.parent.parent is qt
+        qt.remove(r)
+        assert len(qt) == 0 and qt.get_children() == []
+        qt.insert(r)
+        deep = copy.deepcopy(qt)
+        check_qt_data(qt)
+        check_qt_data(deep)
+        assert deep.get_children()[0] is not r
+
+    def test_deeper_than_recursion_limit(self):
+        import sys
+        depth = sys.getrecursionlimit() + 100
+        qt = Node(0, 0, 1, 1, depth)
+        qt.insert(Rectangle(0, 0, 0, 0))
+        copy = pickle.loads(pickle.dumps(qt, 2))
+        assert copy._get_depth() == depth
+        assert copy.get_children_under_point(0, 0) == qt.get_children()
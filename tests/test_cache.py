@@ -0,0 +1,79 @@
+import pytest
+from random import randint, uniform
+from quadpy import Node
+from quadpy.cache import CachedTree
+from quadpy.rectangle import Rectangle, random_bounds, random_rectangle
+
+
+def random_queries(n):
+    return ([random_bounds((-100, -100, 1100, 1100), 300) for _ in range(n)] +
+            [random_bounds((-100, -100, 1100, 1100)) for _ in range(n)])
+
+
+class Test_cached_tree:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'grow': True},
+                                         {'bucket_capacity': 6}])
+    def test_cached_results_match_tree(self, options):
+        qt = Node(0, 0, 1000, 1000, 6, **options)
+        tree = CachedTree(qt, max_size=30)
+        rects = [random_rectangle((-50, -50, 1050, 1050), 30)
+                 for _ in range(300)]
+        tree.insert_many(rects[:200])
+        queries = random_queries(15)
+        points = [(uniform(0, 1000), uniform(0, 1000)) for _ in range(10)]
+        same = ((lambda a, b: a == b) if 'bucket_capacity' not in options
+                else (lambda a, b: sorted(map(id, a)) == sorted(map(id, b))))
+        for step in range(40):
+            r = rects[randint(0, 199)]
+            r.bounds = random_rectangle((-50, -50, 1050, 1050), 30).bounds
+            tree.reinsert(r)
+            tree.move_many((ch, random_rectangle((0, 0, 1000, 1000),
+                                                 30).bounds)
+                           for ch in rects[step:200:40])
+            if step < 100:
+                tree.insert(rects[200 + step])
+            if step % 4 == 0:
+                tree.remove(rects[200 + step])
+            for query in queries + queries[::3]:
+                assert same(tree.get_overlapped_children(query),
+                            qt.get_overlapped_children(query))
+                assert same(tree.get_enclosed_children(query),
+                            qt.get_enclosed_children(query))
+            for x, y in points + points[::2]:
+                assert same(tree.get_children_under_point(x, y),
+                            qt.get_children_under_point(x, y))
+        stats = tree.stats()
+        assert stats['hits'] > 0
+        assert stats['invalidations'] > 0
+        assert stats['size'] <= 30
+
+    def test_counters_and_local_invalidation(self):
+        qt = Node(0, 0, 1000, 1000, 5)
+        tree = CachedTree(qt, max_size=2)
+        a = Rectangle(10, 10, 20, 20)
+        b = Rectangle(900, 900, 910, 910)
+        tree.insert(a)
+        tree.insert(b)
+        assert tree.get_overlapped_children((0, 0, 100, 100)) == [a]
+        assert tree.get_overlapped_children((100, 100, 0, 0)) == [a]
+        assert tree.get_children_under_point(905, 905) == [b]
+        assert (tree.hits, tree.misses) == (1, 2)
+        # far away change keeps the other result
+        b.bounds = (950, 950, 960, 960)
+        tree.reinsert(b)
+        assert tree.invalidations == 1
+        assert tree.get_overlapped_children((0, 0, 100, 100)) == [a]
+        assert tree.hits == 2
+        tree.get_enclosed_children((0, 0, 5, 5))
+        tree.get_enclosed_children((0, 0, 6, 6))
+        assert tree.evictions == 1
+        # returned lists are copies
+        tree.get_enclosed_children((0, 0, 6, 6)).append(b)
+        assert tree.get_enclosed_children((0, 0, 6, 6)) == []
+        tree.remove(a)
+        assert tree.get_overlapped_children((0, 0, 100, 100)) == []
+        tree.clear()
+        assert tree.stats()['size'] == 0 and len(tree) == 0
+        with pytest.raises(ValueError):
+            CachedTree(qt, max_size=0)
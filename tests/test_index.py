@@ -0,0 +1,123 @@
+import pickle
+import pytest
+from quadpy import Index, Node
+from quadpy.rectangle import Rectangle, random_bounds
+
+
+def build_both(options, n=300):
+    item_bounds = [random_bounds((0, 0, 1000, 1000), 30) for _ in range(n)]
+    index = Index(0, 0, 1000, 1000, 6, **options)
+    qt = Node(0, 0, 1000, 1000, 6, **options)
+    rects = dict((i, Rectangle(*b)) for i, b in enumerate(item_bounds))
+    for i, b in enumerate(item_bounds):
+        index.insert(i, b)
+        qt.insert(rects[i])
+    return index, qt, rects
+
+
+def ids_of(children, rects):
+    ids = dict((id(r), i) for i, r in rects.items())
+    return sorted(ids[id(ch)] for ch in children)
+
+
+class Test_index_matches_node:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 6}])
+    def test_queries_after_moves(self, options):
+        index, qt, rects = build_both(options)
+        for step in range(3):
+            for i in list(rects)[::3]:
+                b = random_bounds((0, 0, 1000, 1000), 30)
+                index.move(i, b)
+                rects[i].bounds = b
+                qt.reinsert(rects[i])
+            for i in range(step, len(rects), 7):
+                if i in index:
+                    index.remove(i)
+                    qt.remove(rects.pop(i))
+            assert len(index) == len(qt) == len(rects)
+            assert sorted(index.get_children()) == sorted(rects)
+            for _ in range(30):
+                query = random_bounds((-100, -100, 1100, 1100))
+                assert (sorted(index.get_overlapped_children(query)) ==
+                        ids_of(qt.get_overlapped_children(query), rects))
+                assert (sorted(index.get_enclosed_children(query)) ==
+                        ids_of(qt.get_enclosed_children(query), rects))
+                assert (index.count_overlapped(query) ==
+                        qt.count_overlapped(query))
+
+    def test_nearest_and_pairs(self):
+        index, qt, rects = build_both({})
+        assert (sorted(index.nearest(500, 500, 5)) ==
+                ids_of(qt.nearest(500, 500, 5), rects))
+        assert (sorted(index.within_radius(500, 500, 100)) ==
+                ids_of(qt.within_radius(500, 500, 100), rects))
+        assert (sorted(tuple(sorted(p)) for p in index.overlapping_pairs()) ==
+                sorted(tuple(sorted(ids_of(p, rects)))
+                       for p in qt.overlapping_pairs()))
+
+
+class Test_index:
+    def test_any_hashable_ids(self):
+        index = Index(0, 0, 100, 100)
+        index.insert('a', (10, 10, 20, 20))
+        index.insert((1, 2), (60, 60, 50, 50))
+        index.insert(None, (0, 0, 0, 0))
+        assert index.get_bounds((1, 2)) == (50, 50, 60, 60)
+        assert index.get_children_under_point(55, 55) == [(1, 2)]
+        assert sorted(index.get_enclosed_children((0, 0, 30, 30)),
+                      key=str) == [None, 'a']
+        assert set(index) == set(['a', (1, 2), None])
+
+    def test_insert_many_and_move_many(self):
+        index = Index(0, 0, 100, 100, 3)
+        index.insert_many([(i, (i, i, i + 1, i + 1)) for i in range(90)])
+        assert len(index) == 90
+        index.move_many([(i, (i + 5, i, i + 6, i + 1)) for i in range(90)])
+        assert index.get_bounds(3) == (8, 3, 9, 4)
+        assert sorted(index.get_overlapped_children((9, 0, 9, 100))) == \
+            [3, 4]
+
+    def test_duplicates_and_missing_ids(self):
+        index = Index(0, 0, 100, 100)
+        index.insert(1, (0, 0, 1, 1))
+        with pytest.raises(ValueError):
+            index.insert(1, (2, 2, 3, 3))
+        with pytest.raises(ValueError):
+            index.insert_many([(2, (0, 0, 1, 1)), (2, (0, 0, 1, 1))])
+        assert len(index) == 1
+        with pytest.raises(KeyError):
+            index.move(5, (0, 0, 1, 1))
+        with pytest.raises(KeyError):
+            index.remove(5)
+        index.remove(1)
+        assert len(index) == 0 and len(index.tree) == 0
+
+    def test_query_many(self):
+        index = Index(0, 0, 100, 100, 3)
+        index.insert('a', (10, 10, 20, 20))
+        index.insert('b', (15, 15, 30, 30))
+        offsets, ids = index.query_many([(0, 0, 25, 25), (40, 40, 50, 50),
+                                         (0, 0, 16, 16)], 'enclose')
+        assert offsets == [0, 1, 1, 1]
+        assert ids == ['a']
+
+    def test_clear(self):
+        index = Index(0, 0, 100, 100, grow=True)
+        index.insert(1, (150, 150, 160, 160))
+        index.clear()
+        assert len(index) == 0
+        assert index.get_overlapped_children((0, 0, 1000, 1000)) == []
+        index.insert(1, (1, 1, 2, 2))
+        assert index.get_children() == [1]
+
+    def test_pickling(self):
+        index = Index(0, 0, 100, 100, 3)
+        index.insert_many([(i, (i, i, i + 1, i + 1)) for i in range(90)])
+        copy = pickle.loads(pickle.dumps(index, 2))
+        assert sorted(copy.get_overlapped_children((0, 0, 10, 10))) == \
+            list(range(11))
+        copy.move(5, (50, 50, 51, 51))
+        copy.remove(6)
+        assert sorted(copy.get_overlapped_children((0, 0, 10, 10))) == \
+            [0, 1, 2, 3, 4, 7, 8, 9, 10]
@@ -0,0 +1,28 @@
+import pytest
+from quadpy import Node
+from quadpy.parallel import QueryPool
+from quadpy.rectangle import Rectangle, random_bounds
+
+
+def random_rects(n):
+    return [Rectangle(*random_bounds((-50, -50, 1050, 1050), 40))
+            for _ in range(n)]
+
+
+class Test_parallel:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5}])
+    def test_query_pool_same_as_query_many(self, options):
+        qt = Node(0, 0, 1000, 1000, 6, **options)
+        qt.insert_many(random_rects(500))
+        queries = [random_bounds((-100, -100, 1100, 1100), 200)
+                   for _ in range(50)]
+        with QueryPool(qt, processes=2) as pool:
+            for mode in ['overlap', 'enclose']:
+                offsets, children = pool.query_many(queries, mode)
+                expected = qt.query_many(queries, mode)
+                assert offsets == expected[0]
+                assert all(a is b for a, b in zip(children, expected[1]))
+                assert len(children) == len(expected[1])
+            assert pool.query_many([]) == ([0], [])
+            with pytest.raises(ValueError):
+                pool.query_many(queries, 'within')
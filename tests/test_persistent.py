@@ -0,0 +1,133 @@
+import pytest
+from quadpy import Node
+from quadpy.persistent import PersistentTree, _entries
+from quadpy.quadtree import fits, overlaps
+from quadpy.rectangle import Rectangle, random_bounds, random_rectangle
+
+
+def brute(entries, bounds, test):
+    return sorted(id(ch) for ch, b in entries if test(b, bounds))
+
+
+def ids(children):
+    return sorted(id(ch) for ch in children)
+
+
+def count_nodes(tree):
+    stack, count = [tree._root], 0
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(q for q in node.quadrants or () if q is not None)
+    return count
+
+
+class Test_persistent_tree:
+    def test_old_versions_stay_queryable(self):
+        tree = PersistentTree(0, 0, 1000, 1000, 6)
+        rects = [random_rectangle((-50, -50, 1050, 1050), 40)
+                 for _ in range(200)]
+        versions = [(tree, [])]
+        current = {}
+        for step in range(400):
+            r = rects[step % len(rects)]
+            if id(r) in current and step % 3:
+                old = current.pop(id(r))[1]
+                r.bounds = random_rectangle((-50, -50, 1050, 1050), 40).bounds
+                tree = tree.reinsert(r, old)
+                current[id(r)] = (r, r.bounds)
+            elif id(r) in current:
+                tree = tree.remove(r, current.pop(id(r))[1])
+            else:
+                tree = tree.insert(r)
+                current[id(r)] = (r, r.bounds)
+            versions.append((tree, list(current.values())))
+
+        for tree, entries in versions[::20]:
+            assert len(tree) == len(entries)
+            assert ids(tree.get_children()) == sorted(id(ch)
+                                                      for ch, _ in entries)
+            for _ in range(10):
+                query = random_bounds((-100, -100, 1100, 1100))
+                assert (ids(tree.get_overlapped_children(query)) ==
+                        brute(entries, query, overlaps))
+                assert (ids(tree.get_enclosed_children(query)) ==
+                        brute(entries, query, fits))
+
+    def test_same_cells_as_node(self):
+        tree = PersistentTree(0, 0, 1000, 1000, 5)
+        qt = Node(0, 0, 1000, 1000, 5)
+        for _ in range(100):
+            r = random_rectangle((-50, -50, 1050, 1050), 100)
+            tree = tree.insert(r)
+            qt.insert(r)
+        cells = {}
+        stack = [tree._root]
+        while stack:
+            node = stack.pop()
+            for ch, _ in _entries(node.entries):
+                cells[id(ch)] = node.bounds
+            stack.extend(q for q in node.quadrants or () if q is not None)
+        for ch in qt.get_children():
+            assert cells[id(ch)] == ch.qt_data[0].bounds
+        assert (tree.get_children_under_point(500, 500) ==
+                qt.get_children_under_point(500, 500))
+
+    def test_updates_share_nodes(self):
+        tree = PersistentTree(0, 0, 1024, 1024, 8)
+        for i in range(100):
+            tree = tree.insert(Rectangle(i * 10, i * 10, i * 10 + 1,
+                                         i * 10 + 1))
+        n = count_nodes(tree)
+        r = Rectangle(500.5, 3, 501, 4)
+        newer = tree.insert(r)
+        # only nodes on the path were copied or created
+        shared = set()
+        stack = [tree._root]
+        while stack:
+            node = stack.pop()
+            shared.add(id(node))
+            stack.extend(q for q in node.quadrants or () if q is not None)
+        stack = [newer._root]
+        copied = 0
+        while stack:
+            node = stack.pop()
+            copied += id(node) not in shared
+            if node.quadrants:
+                stack.extend(q for q in node.quadrants if q is not None)
+        assert copied <= 8 + 1
+        assert count_nodes(newer) <= n + 8
+        # removing everything drops all nodes but the root
+        assert count_nodes(newer.remove(r)) == n
+        assert len(tree) == 100 and len(newer) == 101
+
+    def test_entries_shared_between_versions(self):
+        # children crossing the center lines all stay in the root
+        tree = PersistentTree(0, 0, 1000, 1000, 6)
+        rects = [Rectangle(499, i, 501, i + 0.5) for i in range(50)]
+        versions = [tree]
+        for r in rects:
+            versions.append(versions[-1].insert(r))
+        for old, new in zip(versions, versions[1:]):
+            assert new._root.entries[2] is old._root.entries
+        tree = versions[-1]
+        assert tree.get_overlapped_children((0, 0, 1000, 1000)) == rects
+        # removing copies only cells of children inserted later
+        removed = tree.remove(rects[45])
+        assert removed._root.entries[2][2][2][2] is versions[45]._root.entries
+        assert removed.get_children() == rects[:45] + rects[46:]
+        assert tree.get_children() == rects
+
+    def test_remove_errors(self):
+        tree = PersistentTree(0, 0, 100, 100)
+        r = Rectangle(10, 10, 20, 20)
+        with pytest.raises(ValueError):
+            tree.remove(r)
+        tree = tree.insert(r)
+        with pytest.raises(ValueError):
+            tree.remove(r, (60, 60, 70, 70))
+        with pytest.raises(ValueError):
+            tree.remove(Rectangle(10, 10, 20, 20))
+        empty = tree.remove(r)
+        assert len(empty) == 0 and count_nodes(empty) == 1
+        assert tree.get_children() == [r]
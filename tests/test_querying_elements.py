@@ -1,6 +1,8 @@
+import pytest
 from random import randint
-from quadpy import Node
-from quadpy.rectangle import Rectangle
+from quadpy import Node, NodePool
+from quadpy.quadtree import distance, fits, overlaps
+from quadpy.rectangle import Rectangle, random_bounds, random_rectangle
 
 
 key = lambda r: r.bounds
@@ -145,3 +147,329 @@ class Test_tiled_overlapping_tiles:
             for y in range(7, 80, 9):
                 assert len(self.under(x, y)) == 9
         assert len(self.under(9, 9)) == 16
+
+
+class Test_iterators:
+    def setup_class(self):
+        self.qt = Node(0, 0, 1000, 1000, 6)
+        self.rects = [random_rectangle((-50, -50, 1050, 1050), 80)
+                      for _ in range(2000)]
+        [self.qt.insert(r) for r in self.rects]
+
+    def test_iter_children(self):
+        assert list(self.qt.iter_children()) == self.qt.get_children()
+        for q in self.qt.quadrants:
+            assert list(q.iter_children()) == q.get_children()
+
+    def test_same_order_as_get(self):
+        for bounds in [(100, 100, 400, 300), (0, 0, 1000, 1000),
+                       (600, 700, 450, 420), (-100, -100, 2000, 2000),
+                       (500, 500, 500, 500), (2000, 2000, 3000, 3000)]:
+            assert (list(self.qt.iter_overlapped(bounds)) ==
+                    self.qt.get_overlapped_children(bounds))
+            assert (list(self.qt.iter_enclosed(bounds)) ==
+                    self.qt.get_enclosed_children(bounds))
+
+    def test_limit(self):
+        bounds = (100, 100, 700, 700)
+        everything = self.qt.get_overlapped_children(bounds)
+        assert len(everything) > 10
+        assert list(self.qt.iter_overlapped(bounds, limit=10)) == \
+            everything[:10]
+        assert list(self.qt.iter_overlapped(bounds, limit=0)) == []
+        assert list(self.qt.iter_children(limit=3)) == \
+            self.qt.get_children()[:3]
+        enclosed = self.qt.get_enclosed_children(bounds)
+        assert list(self.qt.iter_enclosed(bounds, 5)) == enclosed[:5]
+
+    def test_is_lazy(self):
+        it = self.qt.iter_overlapped((0, 0, 1000, 1000))
+        assert next(it) is self.qt.get_overlapped_children(
+            (0, 0, 1000, 1000))[0]
+        assert next(Node(0, 0, 1, 1).iter_children(), None) is None
+
+
+class Test_loose:
+    def setup_class(self):
+        self.rects = [random_rectangle((0, 0, 1000, 1000), 30)
+                      for _ in range(2000)]
+        self.tight = Node(0, 0, 1000, 1000, 7)
+        self.loose = Node(0, 0, 1000, 1000, 7, looseness=2)
+        [self.tight.insert(r) for r in self.rects]
+        [self.loose.insert(r) for r in self.rects]
+
+    def depths(self, node, depth=0):
+        return depth * len(node.direct_children) + sum(
+            self.depths(q, depth + 1) for q in node.quadrants)
+
+    def test_children_sink_deeper(self):
+        assert self.depths(self.loose) > self.depths(self.tight) * 1.2
+        assert len(self.loose.direct_children) < \
+            len(self.tight.direct_children)
+
+    def test_children_fit_loose_bounds(self):
+        for r in self.rects:
+            node, index = r.qt_data
+            assert node.direct_children[index] is r
+            assert fits(r.bounds, node.loose_bounds)
+
+    def test_same_results_as_tight(self):
+        key = lambda r: r.bounds
+        for _ in range(100):
+            bounds = random_rectangle((-100, -100, 1100, 1100), 400).bounds
+            for method in ['get_overlapped_children', 'get_enclosed_children',
+                           'iter_overlapped', 'iter_enclosed']:
+                got = getattr(self.loose, method)(bounds)
+                exp = getattr(self.tight, method)(bounds)
+                assert sorted(got, key=key) == sorted(exp, key=key)
+            assert (self.loose.count_overlapped(bounds) ==
+                    self.tight.count_overlapped(bounds))
+
+    def test_insert_many_and_reinsert(self):
+        qt = Node(0, 0, 1000, 1000, 7, looseness=1.5)
+        qt.insert_many(self.rects)
+        for r in self.rects:
+            node, index = r.qt_data
+            assert fits(r.bounds, node.loose_bounds)
+            qt.reinsert(r)
+            assert r.qt_data[0].bounds == node.bounds
+        self.test_children_fit_loose_bounds()  # restore qt_data
+
+    def test_invalid_looseness(self):
+        with pytest.raises(ValueError):
+            Node(0, 0, 10, 10, looseness=0.5)
+
+
+class Test_points:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 4}])
+    def test_same_as_overlapping_zero_size_rectangle(self, options):
+        qt = Node(0, 0, 64, 64, 5, **options)
+        rects = ([random_rectangle((-8, -8, 72, 72), 10) for _ in range(500)]
+                 + [Rectangle(x, y, x, y) for x in range(0, 65, 4)
+                    for y in range(0, 65, 4)])
+        [qt.insert(r) for r in rects]
+        # integer points lie on borders of many nodes
+        points = [(x, y) for x in range(-2, 67) for y in range(-2, 67, 3)]
+        points += [(randint(0, 6400) / 100.0, randint(0, 6400) / 100.0)
+                   for _ in range(500)]
+        for (x, y), got in zip(points, qt.get_children_under_points(points)):
+            exp = qt.get_overlapped_children((x, y, x, y))
+            assert got == exp
+            assert qt.get_children_under_point(x, y) == exp
+
+    def test_points_go_down_to_max_depth(self):
+        qt = Node(0, 0, 64, 64, 4)
+        points = [Rectangle(x, y, x, y) for x in range(0, 65, 2)
+                  for y in range(0, 65, 2)]
+        [qt.insert(p) for p in points]
+        for p in points:
+            node = p.qt_data[0]
+            assert node.max_depth == 0
+            assert fits(p.bounds, node.bounds)
+        assert qt.get_children_under_point(32, 32) == [
+            Rectangle(32, 32, 32, 32)]
+
+    def test_empty_batch(self):
+        assert Node(0, 0, 10, 10).get_children_under_points([]) == []
+        assert Node(0, 0, 10, 10).get_children_under_points([(20, 20)]) == [[]]
+
+
+class Test_nearest_and_within_radius:
+    def setup_class(self):
+        self.qt = Node(0, 0, 1000, 1000, 6)
+        self.rects = [random_rectangle((0, 0, 1000, 1000), 30)
+                      for _ in range(1000)]
+        self.qt.insert_many(self.rects)
+
+    def test_nearest(self):
+        for _ in range(50):
+            x, y = randint(-100, 1100), randint(-100, 1100)
+            dist = lambda r: distance(x, y, r.bounds)
+            exp = sorted(dist(r) for r in self.rects)
+            for k in [1, 5, 50]:
+                got = self.qt.nearest(x, y, k)
+                assert len(got) == k
+                assert [dist(r) for r in got] == exp[:k]
+
+    def test_nearest_few_children(self):
+        qt = Node(0, 0, 100, 100)
+        assert qt.nearest(5, 5, 3) == []
+        rect = Rectangle(10, 10, 20, 20)
+        qt.insert(rect)
+        assert qt.nearest(50, 50, 3) == [rect]
+        assert qt.nearest(50, 50, 0) == []
+
+    def test_within_radius(self):
+        for _ in range(50):
+            x, y = randint(-100, 1100), randint(-100, 1100)
+            radius = randint(0, 300)
+            exp = [r for r in self.rects
+                   if distance(x, y, r.bounds) <= radius]
+            got = self.qt.within_radius(x, y, radius)
+            assert sorted(got, key=id) == sorted(exp, key=id)
+
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 8}])
+    def test_within_radius_children_outside_root(self, options):
+        qt = Node(0, 0, 100, 100, 4, **options)
+        rects = ([random_rectangle((0, 0, 100, 100), 10)
+                  for _ in range(100)] +
+                 [random_rectangle((-500, -500, 600, 600), 10)
+                  for _ in range(50)])
+        qt.insert_many(rects)
+        for _ in range(50):
+            x, y = randint(-600, 700), randint(-600, 700)
+            radius = randint(0, 400)
+            exp = [r for r in rects if distance(x, y, r.bounds) <= radius]
+            got = qt.within_radius(x, y, radius)
+            assert sorted(got, key=id) == sorted(exp, key=id)
+        far, near = Rectangle(500, 500, 501, 501), Rectangle(50, 50, 51, 51)
+        qt = Node(0, 0, 100, 100)
+        qt.insert(far)
+        qt.insert(near)
+        assert qt.within_radius(50, 50, 80) == [near]
+        assert qt.within_radius(500, 510, 10) == [far]
+
+    def test_within_radius_whole_tree(self):
+        assert len(self.qt.within_radius(500, 500, 800)) == 1000
+        assert self.qt.within_radius(5000, 5000, 10) == []
+
+
+def brute_pairs(rects_a, rects_b=None):
+    if rects_b is None:
+        return set(frozenset((id(a), id(b)))
+                   for i, a in enumerate(rects_a) for b in rects_a[i + 1:]
+                   if overlaps(a.bounds, b.bounds))
+    return set((id(a), id(b)) for a in rects_a for b in rects_b
+               if overlaps(a.bounds, b.bounds))
+
+
+class Test_pairs:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 2},
+                                         {'bucket_capacity': 8}])
+    def test_overlapping_pairs(self, options):
+        qt = Node(0, 0, 1000, 1000, 6, **options)
+        rects = ([random_rectangle((0, 0, 1000, 1000), 60)
+                  for _ in range(500)] +
+                 [random_rectangle((-100, -100, 1100, 1100))
+                  for _ in range(10)])
+        [qt.insert(r) for r in rects]
+        got = [frozenset((id(a), id(b))) for a, b in qt.overlapping_pairs()]
+        assert len(got) == len(set(got))
+        assert set(got) == brute_pairs(rects)
+
+    @pytest.mark.parametrize('options', [{}, {'looseness': 2},
+                                         {'bucket_capacity': 8},
+                                         {'grow': True},
+                                         {'pool': NodePool()}])
+    def test_pairs_touching_on_grid(self, options):
+        # integer rectangles touch along quadrant borders
+        qt = Node(0, 0, 64, 64, 5, **options)
+        rects = []
+        for _ in range(300):
+            x, y = randint(-4, 66), randint(-4, 66)
+            rects.append(Rectangle(x, y, x + randint(0, 4),
+                                   y + randint(0, 4)))
+        [qt.insert(r) for r in rects]
+        got = [frozenset((id(a), id(b))) for a, b in qt.overlapping_pairs()]
+        assert len(got) == len(set(got))
+        assert set(got) == brute_pairs(rects)
+
+    def test_pairs_across_center_lines(self):
+        qt = Node(0, 0, 10, 10, 2)
+        a, b = Rectangle(0, 0, 5, 5), Rectangle(5, 0, 10, 5)
+        c = Rectangle(5, 5, 5, 5)
+        [qt.insert(r) for r in (a, b, c)]
+        assert set(map(frozenset, qt.overlapping_pairs())) == set(
+            map(frozenset, [(a, b), (a, c), (b, c)]))
+
+    @pytest.mark.parametrize('bounds_b', [(0, 0, 1000, 1000),
+                                          (300, -200, 900, 500),
+                                          (2000, 2000, 2100, 2100)])
+    def test_join(self, bounds_b):
+        rects_a = [random_rectangle((-50, -50, 1050, 1050), 60)
+                   for _ in range(400)]
+        rects_b = [random_rectangle(bounds_b, 60) for _ in range(400)]
+        a = Node(0, 0, 1000, 1000, 6)
+        b = Node(*(bounds_b + (5,)), looseness=1.5)
+        [a.insert(r) for r in rects_a]
+        [b.insert(r) for r in rects_b]
+        got = [(id(x), id(y)) for x, y in a.join(b)]
+        assert len(got) == len(set(got))
+        assert set(got) == brute_pairs(rects_a, rects_b)
+
+    def test_empty(self):
+        assert list(Node(0, 0, 10, 10).overlapping_pairs()) == []
+        assert list(Node(0, 0, 10, 10).join(Node(0, 0, 10, 10))) == []
+
+
+class Test_query_many:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 8}])
+    def test_same_as_single_queries(self, options):
+        qt = Node(0, 0, 1000, 1000, 6, **options)
+        [qt.insert(random_rectangle((-50, -50, 1050, 1050), 60))
+         for _ in range(1000)]
+        queries = ([random_bounds((-100, -100, 1100, 1100), 150)
+                    for _ in range(100)] +
+                   [random_bounds((-100, -100, 1100, 1100))
+                    for _ in range(20)] +
+                   [(500, 500, 500, 500), (2000, 2000, 3000, 3000)])
+        for mode, single in [('overlap', qt.get_overlapped_children),
+                             ('enclose', qt.get_enclosed_children)]:
+            offsets, children = qt.query_many(queries, mode)
+            assert len(offsets) == len(queries) + 1
+            for i, bounds in enumerate(queries):
+                assert (children[offsets[i]:offsets[i + 1]] ==
+                        single(bounds))
+
+    def test_empty_and_bad_mode(self):
+        qt = Node(0, 0, 100, 100)
+        assert qt.query_many([]) == ([0], [])
+        assert qt.query_many([(0, 0, 10, 10)]) == ([0, 0], [])
+        with pytest.raises(ValueError):
+            qt.query_many([(0, 0, 10, 10)], mode='within')
+
+
+class Test_viewport:
+    @pytest.mark.parametrize('options', [{}, {'looseness': 1.5},
+                                         {'bucket_capacity': 8}])
+    def test_deltas_match_queries(self, options):
+        qt = Node(0, 0, 1000, 1000, 6, **options)
+        qt.insert_many(random_rectangle((-50, -50, 1050, 1050), 40)
+                       for _ in range(1000))
+        bounds = (100, 100, 300, 250)
+        viewport = qt.viewport(bounds)
+        visible = set(map(id, qt.get_overlapped_children(bounds)))
+        assert set(map(id, viewport.get_children())) == visible
+        for step in range(100):
+            x_min, y_min, x_max, y_max = bounds
+            if step % 10 == 0:  # jump or zoom
+                bounds = random_bounds((-200, -200, 1200, 1200))
+            else:  # pan
+                dx, dy = randint(-30, 30), randint(-30, 30)
+                bounds = (x_min + dx, y_min + dy, x_max + dx, y_max + dy)
+            entered, exited = viewport.move(bounds)
+            entered, exited = set(map(id, entered)), set(map(id, exited))
+            assert not entered & exited
+            assert not entered & visible
+            assert exited <= visible
+            visible = (visible | entered) - exited
+            assert visible == set(map(id, qt.get_overlapped_children(bounds)))
+            assert len(viewport) == len(visible)
+
+    def test_refresh_after_changes(self):
+        qt = Node(0, 0, 100, 100, 4)
+        a, b = Rectangle(10, 10, 20, 20), Rectangle(60, 60, 70, 70)
+        qt.insert(a)
+        viewport = qt.viewport((0, 0, 50, 50))
+        assert viewport.get_children() == [a]
+        assert viewport.move((0, 0, 50, 50)) == ([], [])
+        qt.insert(b)
+        a.bounds = (80, 80, 90, 90)
+        qt.reinsert(a)
+        b.bounds = (30, 30, 40, 40)
+        qt.reinsert(b)
+        assert viewport.refresh() == ([b], [a])
+        assert viewport.move((55, 55, 100, 100)) == ([a], [b])
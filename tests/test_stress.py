@@ -74,6 +74,7 @@ class Test_stress_insert_and_remove_many_items:
             rect = pop_element()
             qt.remove(rect)
             assert sorted(qt.get_children(), key=key) == sorted(rects, key=key)
+            assert len(qt) == len(rects)
 
         assert qt.get_children() == []
 
@@ -101,3 +102,4 @@ class Test_stress_reinsert:
                 r.bounds = new_bounds
             qt.reinsert(r)
             assert sorted(qt.get_children(), key=key) == sorted(rects, key=key)
+            assert len(qt) == n_elems
@@ -0,0 +1,120 @@
+import threading
+import time
+from quadpy import Node
+from quadpy.quadtree import overlaps
+from quadpy.rectangle import random_bounds, random_rectangle
+from quadpy.threadsafe import RWLock, ThreadSafeTree
+
+
+def make_tree(n=300, **options):
+    qt = Node(0, 0, 1000, 1000, 6, **options)
+    rects = [random_rectangle((0, 0, 1000, 1000), 30) for _ in range(n)]
+    qt.insert_many(rects)
+    return ThreadSafeTree(qt), rects
+
+
+class Test_rw_lock:
+    def test_readers_share_writers_exclude(self):
+        lock = RWLock()
+        lock.acquire_read()
+        lock.acquire_read()  # second reader doesn't block
+        events = []
+
+        def write():
+            with lock.writing():
+                events.append('write')
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.05)
+        assert events == []  # readers still hold the lock
+        lock.release_read()
+        lock.release_read()
+        writer.join(1)
+        assert events == ['write']
+
+    def test_waiting_writer_goes_first(self):
+        lock = RWLock()
+        lock.acquire_read()
+        events = []
+
+        def write():
+            with lock.writing():
+                events.append('write')
+
+        def read():
+            with lock.reading():
+                events.append('read')
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.05)
+        reader = threading.Thread(target=read)
+        reader.start()
+        time.sleep(0.05)
+        assert events == []
+        lock.release_read()
+        writer.join(1)
+        reader.join(1)
+        assert events == ['write', 'read']
+
+
+class Test_thread_safe_tree:
+    def test_snapshot_is_frozen(self):
+        tree, rects = make_tree()
+        query = (200, 200, 700, 700)
+        snapshot = tree.publish()
+        before = tree.get_overlapped_children(query)
+        assert snapshot.get_overlapped_children(query) == before
+        assert (snapshot.get_enclosed_children(query) ==
+                tree.get_enclosed_children(query))
+        assert (snapshot.get_children_under_point(500, 500) ==
+                tree.get_children_under_point(500, 500))
+        assert snapshot.get_children() == tree.get_children()
+        assert snapshot.count_overlapped(query) == len(before)
+        offsets, children = snapshot.query_many([query, (0, 0, 10, 10)])
+        assert children[offsets[0]:offsets[1]] == before
+
+        tree.move_many((r, random_rectangle((0, 0, 1000, 1000), 30).bounds)
+                       for r in rects[:100])
+        for r in rects[100:150]:
+            tree.remove(r)
+        assert snapshot.get_overlapped_children(query) == before
+        assert len(snapshot) == 300 and len(tree) == 250
+        assert tree.snapshot is snapshot
+        tree.publish()
+        assert (tree.snapshot.get_overlapped_children(query) ==
+                tree.get_overlapped_children(query))
+
+    def test_concurrent_readers_and_writer(self):
+        tree, rects = make_tree(200, looseness=1.5)
+        errors = []
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                query = random_bounds((0, 0, 1000, 1000), 300)
+                with tree.lock.reading():
+                    found = tree.node.get_overlapped_children(query)
+                    expected = [r for r in tree.node.get_children()
+                                if overlaps(r.bounds, query)]
+                if sorted(map(id, found)) != sorted(map(id, expected)):
+                    errors.append(query)
+                snapshot = tree.snapshot
+                found = snapshot.get_overlapped_children(query)
+                if len(found) != snapshot.count_overlapped(query):
+                    errors.append(query)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        [r.start() for r in readers]
+        try:
+            for step in range(30):
+                for r in rects[::3]:
+                    tree.move(r, random_rectangle((0, 0, 1000, 1000),
+                                                  30).bounds)
+                tree.remove(rects[step])
+                tree.insert(rects[step])
+                tree.publish()
+        finally:
+            stop.set()
+            [r.join() for r in readers]
+        assert errors == []
+        assert len(tree) == 200